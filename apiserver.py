@@ -0,0 +1,146 @@
+import os
+import sys
+import time
+import socket
+import asyncio
+import importlib
+
+API_MODE = os.environ.get("API_MODE", "task")
+API_HOST = os.environ.get("API_HOST", "0.0.0.0")
+API_PORT = int(os.environ.get("PORT", 8000))
+ADMIN_PORT = int(os.environ.get("ADMIN_PORT", API_PORT + 1))
+API_START_TIMEOUT = float(os.environ.get("API_START_TIMEOUT", 30))
+API_SHUTDOWN_SECONDS = float(os.environ.get("API_SHUTDOWN_SECONDS", 10))
+
+API_MODES = ("task", "process")
+
+
+def bind(host, port):
+    # The listening socket is always created here, so a busy port is an
+    # OSError for ApiServer rather than uvicorn's sys.exit() (inside the bot's
+    # loop, or in a worker that would look like it started)
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    return socket.create_server((host, port), family=family, backlog=2048)
+
+
+# ---------------------------
+# API server lifecycle
+# ---------------------------
+# Runs the FastAPI app (web.py) in one of two modes:
+#   task    - uvicorn on the bot's own event loop (one loop, one process)
+#   process - generated/ is served by a `python -m web` worker process so
+#             large downloads don't compete with the gateway for the GIL;
+#             /metrics and /debug stay in the bot (they read its counters and
+#             traces) on a small in-loop server on ADMIN_PORT (0 disables it).
+# start() returns immediately and brings the servers up in the background;
+# stop() stops whatever is running (or still starting), letting in-flight
+# requests finish for up to API_SHUTDOWN_SECONDS.
+class ApiServer:
+    def __init__(self, artifacts, mode=API_MODE, host=API_HOST, port=API_PORT, admin_port=ADMIN_PORT):
+        if mode not in API_MODES:
+            raise ValueError(f"API_MODE must be one of {', '.join(API_MODES)}, not '{mode}'")
+        self.artifacts = artifacts
+        self.mode = mode
+        self.host = host
+        self.port = port
+        self.admin_port = admin_port
+        self._starting = None
+        self._servers = []  # (uvicorn server, task) on this loop
+        self._process = None
+
+    def start(self):
+        self._starting = asyncio.create_task(self._start())
+        return self._starting
+
+    async def _start(self):
+        started = time.perf_counter()
+        try:
+            if self.mode == "process":
+                await self._start_process()
+                print(f"File server process {self._process.pid} listening on :{self.port}")
+            # Imported on a thread so FastAPI/uvicorn load without blocking the loop
+            web = await asyncio.to_thread(importlib.import_module, "web")
+            if self.mode == "task":
+                await self._serve(web, web.create_app(self.artifacts), self.port)
+            elif self.admin_port:
+                await self._serve(web, web.create_app(), self.admin_port)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[WARN] API server failed to start ({self.mode} mode): {e}")
+            return False
+        where = f"files + admin on :{self.port}" if self.mode == "task" else (
+            f"admin on :{self.admin_port}" if self.admin_port else "admin disabled")
+        print(f"API server up in {self.mode} mode, {where} ({(time.perf_counter() - started) * 1000:.0f} ms)")
+        return True
+
+    # ---- in-loop servers ----
+    async def _serve(self, web, app, port):
+        sock = bind(self.host, port)
+        server = web.LoopServer(web.config(app, API_SHUTDOWN_SECONDS))
+        task = asyncio.create_task(server.serve(sockets=[sock]))
+        self._servers.append((server, task))
+        deadline = time.monotonic() + API_START_TIMEOUT
+        while not server.started:
+            if task.done():
+                task.result()  # re-raises the startup error
+                raise RuntimeError(f"server on :{port} exited during startup")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"server on :{port} did not start in {API_START_TIMEOUT:.0f}s")
+            await asyncio.sleep(0.05)
+
+    # ---- worker process ----
+    async def _start_process(self):
+        # The worker inherits the bound socket and writes to the pipe once
+        # uvicorn is serving; EOF on the pipe means it died during startup
+        sock = bind(self.host, self.port)
+        ready_read, ready_write = os.pipe()
+        try:
+            self._process = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "web",
+                "--root", os.path.abspath(self.artifacts.root), "--fd", str(sock.fileno()),
+                "--ready-fd", str(ready_write), "--parent", str(os.getpid()),
+                "--shutdown-seconds", str(API_SHUTDOWN_SECONDS),
+                cwd=os.path.dirname(os.path.abspath(__file__)), pass_fds=(sock.fileno(), ready_write),
+            )
+        finally:
+            sock.close()
+            os.close(ready_write)
+        reader = asyncio.StreamReader()
+        transport, _ = await asyncio.get_running_loop().connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(ready_read, "rb", 0))
+        try:
+            ready = await asyncio.wait_for(reader.read(1), timeout=API_START_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"file server did not start in {API_START_TIMEOUT:.0f}s")
+        finally:
+            transport.close()
+        if not ready:
+            await self._process.wait()
+            raise RuntimeError(f"file server process exited with code {self._process.returncode}")
+
+    # ---- shutdown ----
+    async def stop(self):
+        if self._starting is not None and not self._starting.done():
+            self._starting.cancel()
+            await asyncio.gather(self._starting, return_exceptions=True)
+
+        for server, _ in self._servers:
+            server.should_exit = True
+        if self._servers:
+            # uvicorn itself cuts connections off after timeout_graceful_shutdown
+            tasks = [task for _, task in self._servers]
+            done, pending = await asyncio.wait(tasks, timeout=API_SHUTDOWN_SECONDS + 5)
+            for task in pending:
+                task.cancel()
+            self._servers = []
+
+        process, self._process = self._process, None
+        if process is not None and process.returncode is None:
+            process.terminate()
+            try:
+                await asyncio.wait_for(process.wait(), timeout=API_SHUTDOWN_SECONDS + 5)
+            except asyncio.TimeoutError:
+                print("[WARN] File server process didn't stop in time; killing it")
+                process.kill()
+                await process.wait()
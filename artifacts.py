@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+
+ARTIFACT_TTL_HOURS = float(os.environ.get("ARTIFACT_TTL_HOURS", 72))
+ARTIFACT_MAX_MB = float(os.environ.get("ARTIFACT_MAX_MB", 500))
+ARTIFACT_SWEEP_MINUTES = float(os.environ.get("ARTIFACT_SWEEP_MINUTES", 10))
+
+
+# ---------------------------
+# Content-addressed store for generated/
+# ---------------------------
+# Artifacts are named by a hash of what produced them (template file identity +
+# render context), so identical renders share one file and skip re-rendering,
+# and concurrent renders never overwrite each other's output. A background
+# sweeper removes files past their TTL and then the oldest ones until the
+# directory fits the size budget. Reusing an artifact refreshes its TTL.
+class ArtifactStore:
+    def __init__(self, root="generated", ttl_hours=ARTIFACT_TTL_HOURS, max_mb=ARTIFACT_MAX_MB,
+                 sweep_minutes=ARTIFACT_SWEEP_MINUTES):
+        self.root = root
+        self.ttl = ttl_hours * 3600
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.sweep_interval = sweep_minutes * 60
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, template_path, context):
+        st = os.stat(template_path)
+        identity = {
+            "template": [os.path.abspath(template_path), st.st_ino, st.st_ctime_ns, st.st_mtime_ns, st.st_size],
+            "context": context,
+        }
+        raw = json.dumps(identity, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()[:32]
+
+    def path(self, key, ext):
+        return os.path.join(self.root, key + ext)
+
+    def is_live(self, path, now=None):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        return (now or time.time()) - st.st_mtime < self.ttl
+
+    def reuse(self, *paths):
+        # True if every path is already a live artifact; bumps their TTL
+        if not all(self.is_live(p) for p in paths):
+            return False
+        for p in paths:
+            try:
+                os.utime(p)
+            except FileNotFoundError:
+                return False
+        return True
+
+    # ---- eviction ----
+    def _scan(self):
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def sweep(self):
+        now = time.time()
+        files = self._scan()
+        removed = freed = 0
+
+        live = []
+        for mtime, size, path in files:
+            if now - mtime >= self.ttl:
+                if self._remove(path):
+                    removed += 1
+                    freed += size
+            else:
+                live.append((mtime, size, path))
+
+        total = sum(size for _, size, _ in live)
+        for mtime, size, path in sorted(live):
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                removed += 1
+                freed += size
+                total -= size
+
+        # Drop directories emptied by the sweep (e.g. old bulk jobs)
+        for dirpath, dirnames, filenames in os.walk(self.root, topdown=False):
+            if dirpath != self.root and not dirnames and not filenames:
+                try:
+                    os.rmdir(dirpath)
+                except OSError:
+                    pass
+        return removed, freed
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    async def run_sweeper(self):
+        while True:
+            try:
+                removed, freed = await asyncio.to_thread(self.sweep)
+                if removed:
+                    print(f"Artifact sweep removed {removed} files ({freed // 1024} KiB)")
+            except Exception as e:
+                print(f"[WARN] Artifact sweep failed: {e}")
+            await asyncio.sleep(self.sweep_interval)
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import asyncio
+
+AUDIT_FLUSH_SECONDS = float(os.environ.get("AUDIT_FLUSH_SECONDS", 2))
+AUDIT_MAX_BACKOFF = float(os.environ.get("AUDIT_MAX_BACKOFF", 60))
+AUDIT_SPILL_FILE = os.environ.get("AUDIT_SPILL_FILE", "audit_spill.jsonl")
+MESSAGE_LIMIT = 2000
+NO_MENTIONS = {"parse": []}
+
+
+# ---------------------------
+# Audit log pipeline
+# ---------------------------
+# Commands call `log` which only appends to an in-memory list, so logging
+# never waits on Discord. A background task wakes shortly after the first
+# entry (letting a burst collect), packs everything pending into as few log
+# channel messages as fit Discord's 2000 character limit and posts them in
+# order through DiscordREST. Each line carries a Discord timestamp so
+# batching doesn't lose when it happened.
+#
+# If a post fails, that entry and everything after it are written to a local
+# spill file (JSON lines). The next flush sends the spill file first, so
+# ordering holds across outages and restarts; retries back off exponentially.
+class AuditLog:
+    def __init__(self, channel_id, interval=AUDIT_FLUSH_SECONDS, spill_path=AUDIT_SPILL_FILE):
+        self.channel_id = channel_id
+        self.interval = interval
+        self.spill_path = spill_path
+        self.rest = None
+        self._pending = []
+        self._wakeup = None
+        self._task = None
+
+    @property
+    def backlog(self):
+        return len(self._pending)
+
+    def log(self, message):
+        self._pending.append((int(time.time()), message))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self, rest):
+        self.rest = rest
+        self._wakeup = asyncio.Event()
+        if self._pending or os.path.exists(self.spill_path):
+            self._wakeup.set()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        delay = self.interval
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(delay)
+            self._wakeup.clear()
+            try:
+                delivered = await self.flush()
+            except Exception as e:
+                print(f"[WARN] Audit log flush failed: {e}")
+                delivered = False
+            if delivered:
+                delay = self.interval
+            else:
+                delay = min(delay * 2, AUDIT_MAX_BACKOFF)
+                self._wakeup.set()
+
+    async def flush(self):
+        # True once nothing is left pending or spilled
+        spilled = await asyncio.to_thread(self._read_spill)
+        entries, self._pending = spilled + self._pending, []
+        if not entries:
+            return True
+
+        sent = 0
+        try:
+            for batch in _pack(entries):
+                try:
+                    response = await self.rest.send_message(
+                        self.channel_id, {"content": _render(batch), "allowed_mentions": NO_MENTIONS}
+                    )
+                    ok = response.ok
+                except Exception:
+                    ok = False
+                if not ok:
+                    break
+                sent += len(batch)
+        finally:
+            # Also runs when cancelled at shutdown, so nothing is dropped
+            if spilled or sent < len(entries):
+                self._write_spill(entries[sent:])
+        return sent == len(entries)
+
+    async def close(self, timeout=10):
+        if self._task is not None:
+            # Let a cancelled flush finish spilling before the final flush
+            # reads and rewrites the spill file
+            task, self._task = self._task, None
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if self.rest is None:
+            self._write_spill(self._read_spill() + self._pending)
+            self._pending = []
+            return
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            print("[WARN] Audit log not delivered before shutdown; kept in spill file")
+
+    # ---- spill file ----
+    def _read_spill(self):
+        entries = []
+        try:
+            with open(self.spill_path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    entries.append((record["ts"], record["message"]))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _write_spill(self, entries):
+        if not entries:
+            if os.path.exists(self.spill_path):
+                os.remove(self.spill_path)
+            return
+        tmp_path = self.spill_path + ".part"
+        with open(tmp_path, "w") as f:
+            f.write("".join(json.dumps({"ts": ts, "message": message}) + "\n" for ts, message in entries))
+        os.replace(tmp_path, self.spill_path)
+
+
+def _line(entry):
+    ts, message = entry
+    return f"<t:{ts}:T> {message}"[:MESSAGE_LIMIT]
+
+
+def _render(batch):
+    return "\n".join(_line(entry) for entry in batch)
+
+
+def _pack(entries):
+    batch, size = [], 0
+    for entry in entries:
+        length = len(_line(entry)) + 1
+        if batch and size + length > MESSAGE_LIMIT + 1:
+            yield batch
+            batch, size = [], 0
+        batch.append(entry)
+        size += length
+    if batch:
+        yield batch
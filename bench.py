@@ -0,0 +1,269 @@
+"""Offline benchmarks for the bot's hot paths.
+
+Generates synthetic DOCX templates and synthetic stores of several sizes and
+times field extraction, rendering, PDF conversion, template saves and the
+warnings add/history cycle. Nothing here talks to Discord.
+
+    python bench.py                       # full run, JSON to stdout
+    python bench.py --quick -o out.json   # smaller sizes, written to a file
+    python bench.py --compare base.json   # exit 1 if anything got >20% slower
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import contextlib
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime, timedelta
+
+from docx import Document
+from docxtpl import DocxTemplate
+
+from documents import extract_fields
+from docrender import render_docx, docx_to_pdf
+from storage import Database, WarningsStore, SQL_WARNING_INSERT
+
+DOC_SIZES = [10, 100, 1000]
+REGISTRY_SIZES = [10, 1000, 10000]
+WARNING_COUNTS = [100, 10000, 100000]
+QUICK_DOC_SIZES = [10, 100]
+QUICK_REGISTRY_SIZES = [10, 1000]
+QUICK_WARNING_COUNTS = [100, 10000]
+
+
+# ---------------------------
+# Synthetic inputs
+# ---------------------------
+def make_template(path, paragraphs):
+    # One placeholder per paragraph, a table every 50 and a header, so the
+    # parts extract_fields scans all have content
+    doc = Document()
+    doc.sections[0].header.paragraphs[0].text = "Header {{ company }}"
+    doc.add_heading("Synthetic template {{ title }}", level=1)
+    for i in range(paragraphs):
+        doc.add_paragraph(f"Paragraph {i}: dear {{{{ field_{i % 50} }}}}, this is filler text for sizing.")
+        if i % 50 == 49:
+            table = doc.add_table(rows=2, cols=2)
+            table.cell(0, 0).text = "{{ company }}"
+            table.cell(1, 1).text = f"{{{{ field_{i % 50} }}}}"
+    doc.save(path)
+    return path
+
+
+def make_context(fields):
+    return {name: f"value for {name}" for name in fields}
+
+
+def template_record(i):
+    return {"file_path": f"templates/{i}_synthetic.docx", "fields": [f"field_{j}" for j in range(10)]}
+
+
+# ---------------------------
+# Timing
+# ---------------------------
+def measure(func, repeat, warmup=1):
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "runs": repeat,
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+    }
+
+
+class Suite:
+    def __init__(self, workdir, repeat, pattern=None):
+        self.workdir = workdir
+        self.repeat = repeat
+        self.pattern = pattern
+        self.results = []
+
+    def run(self, name, params, func, repeat=None, warmup=1):
+        label = name + "".join(f"[{k}={v}]" for k, v in params.items())
+        if self.pattern and self.pattern not in label:
+            return
+        result = {"name": name, "params": params, **measure(func, repeat or self.repeat, warmup)}
+        self.results.append(result)
+        print(f"{label:<50} median {result['median_ms']:>10.3f} ms", file=sys.stderr)
+
+
+# ---------------------------
+# Benchmarks
+# ---------------------------
+def bench_documents(suite, sizes):
+    for paragraphs in sizes:
+        path = make_template(os.path.join(suite.workdir, f"template_{paragraphs}.docx"), paragraphs)
+        fields = extract_fields(path)
+        context = make_context(fields)
+        out = os.path.join(suite.workdir, f"out_{paragraphs}.docx")
+        pdf = os.path.join(suite.workdir, f"out_{paragraphs}.pdf")
+        params = {"paragraphs": paragraphs}
+        # Render-heavy cases get fewer runs so the full suite stays reasonable
+        slow_repeat = max(3, suite.repeat // (1 + paragraphs // 100))
+
+        suite.run("extract_fields", params, lambda: extract_fields(path))
+
+        def render_uncached():
+            doc = DocxTemplate(path)
+            doc.render(context)
+            doc.save(out)
+        suite.run("docxtpl_render_uncached", params, render_uncached, repeat=slow_repeat)
+        suite.run("render_docx_cached", params, lambda: render_docx(path, context, out), repeat=slow_repeat)
+
+        def convert():
+            if os.path.exists(pdf):
+                os.remove(pdf)
+            docx_to_pdf(out, pdf)
+        suite.run("docx_to_pdf", params, convert, repeat=slow_repeat)
+
+
+def bench_collections(suite, sizes):
+    for size in sizes:
+        db = Database(os.path.join(suite.workdir, f"collections_{size}.db"))
+        templates = db.collection("docx_templates")
+        for i in range(size):
+            templates.set(f"template_{i}", template_record(i))
+        templates.flush()
+        params = {"templates": size}
+        counter = iter(range(10 ** 9))
+
+        def save_template():
+            i = next(counter)
+            templates.set(f"bench_{i % 100}", template_record(i))
+            templates.flush()
+        suite.run("save_template", params, save_template)
+        # The startup load (SELECT + decode) without registering another Collection
+        suite.run("load_templates", params, lambda: db.load_collection("docx_templates"), repeat=max(3, suite.repeat // 5))
+        suite.run("lookup_template", params, lambda: templates.get(f"template_{size // 2}"))
+        db.close()
+
+
+def bench_warnings(suite, counts):
+    loop = asyncio.new_event_loop()
+    try:
+        for count in counts:
+            db = Database(os.path.join(suite.workdir, f"warnings_{count}.db"))
+            store = WarningsStore(db)
+            rng = random.Random(count)
+            start = datetime(2024, 1, 1)
+            rows = [
+                (rng.randrange(1000), "moderator", 1, "synthetic reason", str(start + timedelta(minutes=i)))
+                for i in range(count)
+            ]
+
+            def seed():
+                with db.conn:
+                    db.conn.executemany(SQL_WARNING_INSERT, rows)
+            db.call(seed)
+            params = {"warnings": count}
+
+            suite.run("warn_add", params, lambda: loop.run_until_complete(
+                store.add(42, "moderator", 1, "bench", str(datetime.utcnow()))))
+            suite.run("warnings_history", params, lambda: loop.run_until_complete(store.history(42)))
+            suite.run("warnings_history_filtered", params, lambda: loop.run_until_complete(
+                store.history(42, moderator="moderator", moderator_id=1, since="2024-01-02", limit=10, offset=10)))
+            db.close()
+    finally:
+        loop.close()
+
+
+BENCHMARKS = {
+    "documents": bench_documents,
+    "collections": bench_collections,
+    "warnings": bench_warnings,
+}
+
+
+# ---------------------------
+# Output
+# ---------------------------
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, "r") as f:
+        baseline = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        base = baseline.get((r["name"], json.dumps(r["params"], sort_keys=True)))
+        if base and base["median_ms"] > 0:
+            ratio = r["median_ms"] / base["median_ms"]
+            if ratio > 1 + threshold:
+                regressions.append({"name": r["name"], "params": r["params"], "baseline_ms": base["median_ms"],
+                                    "median_ms": r["median_ms"], "ratio": round(ratio, 2)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="smaller sizes and fewer runs")
+    parser.add_argument("--repeat", type=int, default=None, help="runs per benchmark (default 20, quick 5)")
+    parser.add_argument("-k", "--filter", default=None, help="only run benchmarks whose label contains this")
+    parser.add_argument("--only", choices=sorted(BENCHMARKS), action="append", help="benchmark groups to run")
+    parser.add_argument("-o", "--output", default=None, help="write JSON results here instead of stdout")
+    parser.add_argument("--compare", default=None, help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    repeat = args.repeat or (5 if args.quick else 20)
+    sizes = {
+        "documents": QUICK_DOC_SIZES if args.quick else DOC_SIZES,
+        "collections": QUICK_REGISTRY_SIZES if args.quick else REGISTRY_SIZES,
+        "warnings": QUICK_WARNING_COUNTS if args.quick else WARNING_COUNTS,
+    }
+
+    # Progress and the stores' own messages go to stderr; stdout is the report
+    with tempfile.TemporaryDirectory(prefix="hrbench-") as workdir, contextlib.redirect_stdout(sys.stderr):
+        suite = Suite(workdir, repeat, args.filter)
+        for group in args.only or BENCHMARKS:
+            BENCHMARKS[group](suite, sizes[group])
+
+    report = {"environment": environment(), "results": suite.results}
+    if args.compare:
+        report["regressions"] = compare(suite.results, args.compare, args.threshold)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if report.get("regressions"):
+        for r in report["regressions"]:
+            print(f"REGRESSION {r['name']} {r['params']}: {r['baseline_ms']} -> {r['median_ms']} ms "
+                  f"(x{r['ratio']})", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,30 @@
+import startup
+import io
 import os
+import csv
 import json
+import hashlib
 import re
-import threading
+import signal
 import asyncio
 from discord.ext import commands
 from discord import app_commands, Embed
-from docxtpl import DocxTemplate
-from docx import Document
 import discord
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-import uvicorn
 from datetime import datetime, timezone
-import aiohttp
+startup.mark("discord")
+from documents import RENDER_WARMUP, RenderService, RenderQueueFull, extract_fields, parse_bulk_rows, write_zip
+from artifacts import ArtifactStore
+from apiserver import ApiServer
+from discord_rest import DiscordREST, scan_message_payload, build_multipart
+from campaigns import DMCampaigns
+from modmail import TicketIndex, relay_message
+from storage import Database, WarningsStore
+from audit import AuditLog
+from containers import ContainerTemplates, DEFAULT_CONTAINERS
+from scheduler import AnnouncementScheduler, RECURRENCES
+import metrics
+from tracing import span
+startup.mark("bot modules")
 
 # ---------------------------
 # Setup folders and files
@@ -21,12 +33,26 @@ os.makedirs("templates", exist_ok=True)
 os.makedirs("generated", exist_ok=True)
 os.makedirs("dm_templates", exist_ok=True)
 
-if not os.path.exists("templates.json"):
-    with open("templates.json", "w") as f:
-        json.dump({}, f)
-if not os.path.exists("dm_templates.json"):
-    with open("dm_templates.json", "w") as f:
-        json.dump({}, f)
+# All bot state lives in one SQLite database. The old JSON files are imported
+# (and renamed to *.migrated) the first time it starts.
+db = Database()
+db.import_legacy_files()
+startup.mark("database")
+
+# Template collections are served from memory; writes go to the database in
+# the background.
+docx_templates = db.collection("docx_templates")
+dm_templates = db.collection("dm_templates")
+embed_templates = db.collection("embed_templates")
+
+# DOCX rendering runs in a bounded process pool so it never blocks the gateway
+render_service = RenderService()
+
+# Generated documents are content-addressed and swept by age/total size
+artifacts = ArtifactStore("generated")
+
+# FastAPI file server, on the bot's loop or in a worker process (API_MODE)
+api_server = ApiServer(artifacts)
 
 # ---------------------------
 # Role IDs
@@ -52,25 +78,19 @@ async def require_role(interaction: discord.Interaction, role_id: int):
 # ---------------------------
 # Helper functions
 # ---------------------------
-def extract_fields(file_path):
-    doc = Document(file_path)
-    text = "\n".join([p.text for p in doc.paragraphs])
-    fields = re.findall(r"\{\{(.*?)\}\}", text)
-    return list(set(fields))
+async def save_upload(attachment, file_path):
+    # Written next to the target and renamed over it, so a replaced template
+    # is a new file (new inode) and the render cache can't mistake it for the
+    # old one even when size and mtime match
+    part_path = file_path + ".part"
+    await attachment.save(part_path)
+    os.replace(part_path, file_path)
 
 def save_template(template_name, file_path, fields):
-    with open("templates.json", "r") as f:
-        templates = json.load(f)
-    templates[template_name] = {"file_path": file_path, "fields": fields}
-    with open("templates.json", "w") as f:
-        json.dump(templates, f, indent=4)
+    docx_templates.set(template_name, {"file_path": file_path, "fields": fields})
 
 def save_dm_template(template_name, content, fields):
-    with open("dm_templates.json", "r") as f:
-        templates = json.load(f)
-    templates[template_name] = {"content": content, "fields": fields}
-    with open("dm_templates.json", "w") as f:
-        json.dump(templates, f, indent=4)
+    dm_templates.set(template_name, {"content": content, "fields": fields})
 
 BASE_URL = os.environ.get("RAILWAY_PUBLIC_DOMAIN", "http://localhost:8000")
 GUILD_ID = int(os.environ.get("GUILD_ID", 0))
@@ -78,6 +98,8 @@ if not GUILD_ID:
     raise ValueError("GUILD_ID not set in environment variables")
 
 LOG_CHANNEL_ID = 1411299414869282847
+# Log channel entries are batched and posted in the background
+audit_log = AuditLog(LOG_CHANNEL_ID)
 DARK_BLUE = discord.Color.from_rgb(20, 40, 120)
 
 # ---------------------------
@@ -89,25 +111,190 @@ intents.members = True
 
 class MyBot(commands.Bot):
     def __init__(self):
-        super().__init__(command_prefix="!", intents=intents)
+        super().__init__(command_prefix="!", intents=intents, tree_cls=metrics.InstrumentedTree)
+        self.rest = None  # created in setup_hook, after login
 
     async def setup_hook(self):
-        await self.tree.sync(guild=discord.Object(id=GUILD_ID))
+        # One pooled, rate-limit aware session for raw v10 REST calls
+        self.rest = DiscordREST(os.environ['DISCORD_TOKEN'])
+        await self.rest.start()
+        audit_log.start(self.rest)
+        scheduler.start()
+        render_service.start()
+        self.sweeper_task = asyncio.create_task(artifacts.run_sweeper())
+        resumed = dm_campaigns.resume_all()
+        if resumed:
+            print(f"Resuming DM campaigns: {', '.join(resumed)}")
+        await self.sync_commands(force=os.environ.get("FORCE_COMMAND_SYNC") == "1")
+        startup.mark("login + setup")
+        print(startup.report())
+        api_server.start()
+        # Deploys stop the bot with SIGTERM; shut down like Ctrl+C does so the
+        # API server drains and the database is flushed
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+        except NotImplementedError:
+            pass
+        if RENDER_WARMUP:
+            asyncio.create_task(self.warm_up_renderers())
+
+    async def warm_up_renderers(self):
+        try:
+            workers, seconds = await render_service.warm_up()
+            print(f"Render workers warmed up ({workers} processes, {seconds:.1f}s)")
+        except Exception as e:
+            print(f"[WARN] Render warm-up failed: {e}")
+
+    def command_signature(self, guild):
+        # Hash of exactly what a sync would upload (names, options, descriptions, ...)
+        commands = sorted((c.to_dict(self.tree) for c in self.tree.get_commands(guild=guild)), key=lambda c: c["name"])
+        return hashlib.sha256(json.dumps(commands, sort_keys=True).encode("utf-8")).hexdigest()
+
+    async def sync_commands(self, force=False):
+        # Bulk-overwriting the tree is rate limited, so only sync when the
+        # registered commands differ from what was last synced
+        guild = discord.Object(id=GUILD_ID)
+        signature = self.command_signature(guild)
+        meta_key = f"command_tree_hash:{GUILD_ID}"
+        if not force and await db.get_meta_async(meta_key) == signature:
+            print("Slash commands unchanged; skipping sync")
+            return False
+        await self.tree.sync(guild=guild)
+        await db.set_meta_async(meta_key, signature)
         print("Slash commands synced!")
+        return True
+
+    async def wait_for(self, event, /, *, check=None, timeout=None):
+        # Time spent waiting on the user shows up as its own span in traces
+        with span(f"wait_for {event}"):
+            return await super().wait_for(event, check=check, timeout=timeout)
+
+    async def on_app_command_completion(self, interaction, command):
+        metrics.observe_command(interaction, command, "ok")
+
+    async def close(self):
+        if self.is_closed():
+            return
+        await api_server.stop()
+        await dm_campaigns.stop()
+        scheduler.stop()
+        render_service.shutdown()
+        await audit_log.close()
+        if self.rest:
+            await self.rest.close()
+        db.close()
+        await super().close()
 
 bot = MyBot()
 
-async def log_action(bot, message: str):
-    channel = bot.get_channel(LOG_CHANNEL_ID)
+# Mass-DM campaigns; progress is persisted so an interrupted run resumes
+dm_campaigns = DMCampaigns(bot, db.collection("dm_campaigns"))
+
+OUTPUT_FORMATS = [
+    app_commands.Choice(name="DOCX (Office web viewer)", value="docx"),
+    app_commands.Choice(name="PDF (direct link, simplified layout: no page numbers or vector images)", value="pdf"),
+]
+
+def pdf_path_for(output_docx):
+    return os.path.splitext(output_docx)[0] + ".pdf"
+
+def document_url(output_docx, output_format):
+    # PDFs are served straight from /generated; DOCX goes through the Office viewer
+    if output_format == "pdf":
+        return f"{BASE_URL}/generated/{os.path.basename(pdf_path_for(output_docx))}"
+    return f"https://view.officeapps.live.com/op/embed.aspx?src={BASE_URL}/generated/{os.path.basename(output_docx)}"
+
+async def render_or_report(dm_channel, template_path, context, output_format="docx"):
+    # Returns the DOCX path in generated/, or None after telling the user why
+    output_path = artifacts.path(artifacts.key(template_path, context), ".docx")
+    pdf_path = pdf_path_for(output_path) if output_format == "pdf" else None
+    if artifacts.reuse(*filter(None, (output_path, pdf_path))):
+        return output_path
+    try:
+        await render_service.render(template_path, context, output_path, pdf_path)
+        return output_path
+    except RenderQueueFull:
+        await dm_channel.send("⏳ The document renderer is busy right now. Please try again in a minute.")
+    except asyncio.TimeoutError:
+        await dm_channel.send("❌ Rendering took too long and was cancelled.")
+    except Exception as e:
+        await dm_channel.send(f"❌ Failed to render document: {e}")
+    return None
+
+# ---------------------------
+# Broadcast helpers
+# ---------------------------
+BROADCAST_DESCRIBE = dict(
+    channels="Extra channels to post in (mentions or IDs, space separated)",
+    category="Post in every text channel of this category",
+)
+
+async def resolve_channels(guild, channel=None, channels=None, category=None):
+    # Single channel, a list of mentions/IDs and/or a category. Listed IDs can
+    # be anything the bot can post in (text/voice channels, threads, forum
+    # posts); categories are expanded to their text channels, and IDs that
+    # aren't cached are fetched. Returns (targets, skipped), where skipped is
+    # a list of (id, reason) for IDs that couldn't be used.
+    targets, skipped = {}, []
     if channel:
-        try:
-            await channel.send(f"📘 **Log:** {message}")
-        except:
-            print("[WARN] Could not send log message")
+        targets[channel.id] = channel
+    for raw_id in re.findall(r"\d{15,21}", channels or ""):
+        channel_id = int(raw_id)
+        found = guild.get_channel_or_thread(channel_id)
+        if found is None:
+            try:
+                found = await guild.fetch_channel(channel_id)
+            except (discord.NotFound, discord.InvalidData):
+                skipped.append((channel_id, "not a channel in this server"))
+                continue
+            except discord.HTTPException as e:
+                skipped.append((channel_id, f"lookup failed: {e.status}"))
+                continue
+        if isinstance(found, discord.CategoryChannel):
+            targets.update({c.id: c for c in found.text_channels})
+        elif isinstance(found, discord.abc.Messageable):
+            targets[found.id] = found
+        else:
+            skipped.append((channel_id, f"can't post in a {found.type} channel directly"))
+    if category:
+        targets.update({c.id: c for c in category.text_channels})
+    return list(targets.values()), skipped
+
+def describe_skipped(skipped):
+    if not skipped:
+        return ""
+    return "\n⚠️ Skipped: " + ", ".join(f"`{channel_id}` ({reason})" for channel_id, reason in skipped)
+
+async def broadcast_container(targets, payload, what="Container", skipped=()):
+    # Posts one payload to every target and returns a single report message
+    results = await bot.rest.broadcast([c.id for c in targets], payload)
+    sent, failed = [], []
+    for target, result in zip(targets, results):
+        if isinstance(result, Exception):
+            failed.append(f"{target.mention}: {result}")
+        elif result.ok:
+            sent.append(target.mention)
+        else:
+            failed.append(f"{target.mention}: {result.status} {result.text[:200]}")
+
+    if len(targets) == 1:
+        if sent:
+            report = f"✅ {what} sent to {sent[0]}"
+        else:
+            report = f"❌ Failed to send {what.lower()}: {failed[0].split(': ', 1)[1]}"
+    else:
+        report = f"✅ {what} sent to {len(sent)}/{len(targets)} channels."
+        if failed:
+            report += "\n❌ Failed:\n" + "\n".join(failed)
+    return (report + describe_skipped(skipped))[:1900]
+
+def log_action(message: str):
+    # Queued and posted to the log channel in batches; never waits on Discord
+    audit_log.log(f"📘 **Log:** {message}")
 
 @bot.event
 async def on_ready():
-    print(f"Logged in as {bot.user}")
+    print(f"Logged in as {bot.user} ({startup.elapsed():.1f}s after start)")
     await bot.change_presence(activity=discord.Game(name="Thornvale Academy"))
 
 
@@ -145,37 +332,37 @@ async def add_template(interaction: discord.Interaction):
     template_name = name_msg.content
     file_ext = os.path.splitext(file.filename)[1]
     file_path = f"templates/{interaction.user.id}_{int(datetime.now().timestamp())}{file_ext}"
-    await file.save(file_path)
-    fields = extract_fields(file_path)
+    with span("save template"):
+        await save_upload(file, file_path)
+        fields = extract_fields(file_path)
     save_template(template_name, file_path, fields)
     await interaction.followup.send(f"Template '{template_name}' added with fields: {fields}")
-    await log_action(bot, f"{interaction.user} added template '{template_name}'")
+    log_action(f"{interaction.user} added template '{template_name}'")
 
 @bot.tree.command(name="list_docx_templates", description="List all DOCX templates", guild=discord.Object(id=GUILD_ID))
 async def list_docx_templates(interaction: discord.Interaction):
     if not await require_role(interaction, ROLE_DOCUMENT_MANAGER):
         return
-    with open("templates.json", "r") as f:
-        templates = json.load(f)
-    if not templates:
+    names = docx_templates.names()
+    if not names:
         await interaction.response.send_message("No DOCX templates found.", ephemeral=True)
         return
-    await interaction.response.send_message("📑 DOCX Templates:\n" + "\n".join(templates.keys()), ephemeral=True)
+    await interaction.response.send_message("📑 DOCX Templates:\n" + "\n".join(names), ephemeral=True)
 
 @bot.tree.command(name="generate_document", description="Generate a document from a template", guild=discord.Object(id=GUILD_ID))
-@app_commands.describe(template_name="Name of the template to use")
-async def generate_document(interaction: discord.Interaction, template_name: str):
+@app_commands.describe(template_name="Name of the template to use", output_format="How the document should be delivered")
+@app_commands.choices(output_format=OUTPUT_FORMATS)
+async def generate_document(interaction: discord.Interaction, template_name: str, output_format: str = "docx"):
     if not await require_role(interaction, ROLE_DOCUMENT_MANAGER):
         return
     await interaction.response.send_message(f"Generating document for template '{template_name}'. Check your DMs!", ephemeral=True)
 
-    with open("templates.json", "r") as f:
-        templates = json.load(f)
-    if template_name not in templates:
+    template = docx_templates.get(template_name)
+    if template is None:
         await interaction.followup.send("Template not found.", ephemeral=True)
         return
 
-    fields = templates[template_name]["fields"]
+    fields = template["fields"]
     try:
         dm_channel = await interaction.user.create_dm()
         await dm_channel.send(f"Please provide the following fields: {fields}")
@@ -196,17 +383,101 @@ async def generate_document(interaction: discord.Interaction, template_name: str
             await dm_channel.send("Timeout waiting for input.")
             return
 
-    doc = DocxTemplate(templates[template_name]["file_path"])
-    doc.render(responses)
-    output_docx = f"generated/{interaction.user.id}_{template_name}.docx"
-    doc.save(output_docx)
+    output_docx = await render_or_report(dm_channel, template["file_path"], responses, output_format)
+    if output_docx is None:
+        return
 
-    view_url = f"https://view.officeapps.live.com/op/embed.aspx?src={BASE_URL}/generated/{os.path.basename(output_docx)}"
+    view_url = document_url(output_docx, output_format)
     await dm_channel.send(f"Here is your document (viewable in browser): {view_url}")
-    await log_action(bot, f"{interaction.user} generated document from '{template_name}'")
+    log_action(f"{interaction.user} generated document from '{template_name}'")
+
+@bot.tree.command(name="generate_bulk", description="Generate one document per row of a CSV/JSON file", guild=discord.Object(id=GUILD_ID))
+@app_commands.describe(
+    template_name="Name of the template to use",
+    data="CSV (with a header row) or JSON list, one row per recipient",
+    output="Return a single ZIP or a link per document"
+)
+@app_commands.choices(output=[
+    app_commands.Choice(name="ZIP archive", value="zip"),
+    app_commands.Choice(name="Links", value="links"),
+])
+async def generate_bulk(interaction: discord.Interaction, template_name: str, data: discord.Attachment, output: str = "zip"):
+    if not await require_role(interaction, ROLE_DOCUMENT_MANAGER):
+        return
+    await interaction.response.defer(ephemeral=True)
+
+    template = docx_templates.get(template_name)
+    if template is None:
+        await interaction.followup.send("Template not found.", ephemeral=True)
+        return
+
+    try:
+        rows = parse_bulk_rows(data.filename, await data.read())
+    except Exception as e:
+        await interaction.followup.send(f"❌ Could not read {data.filename}: {e}", ephemeral=True)
+        return
+
+    # Rows missing a template field are reported instead of rendered
+    fields = template["fields"]
+    errors = {}
+    for i, row in enumerate(rows):
+        missing = [f for f in fields if f not in row]
+        if missing:
+            errors[i] = f"missing fields: {', '.join(missing)}"
+    todo = [i for i in range(len(rows)) if i not in errors]
+
+    # Rows identical to an earlier render reuse its artifact
+    outputs = {i: artifacts.path(artifacts.key(template["file_path"], rows[i]), ".docx") for i in todo}
+    todo = [i for i in todo if not artifacts.reuse(outputs[i])]
+
+    progress_msg = await interaction.followup.send(f"⏳ Rendering 0/{len(todo)} documents…", ephemeral=True, wait=True)
+    last_update = 0
+
+    async def progress(done, total):
+        nonlocal last_update
+        now = asyncio.get_running_loop().time()
+        if done == total or now - last_update >= 2:
+            last_update = now
+            try:
+                await progress_msg.edit(content=f"⏳ Rendering {done}/{total} documents…")
+            except discord.HTTPException:
+                pass
+
+    results = await render_service.render_many(
+        template["file_path"], [rows[i] for i in todo], [outputs[i] for i in todo], progress=progress
+    )
+    for i, result in zip(todo, results):
+        if isinstance(result, Exception):
+            errors[i] = str(result) or type(result).__name__
+    rendered = [i for i in outputs if i not in errors]
+
+    # Per-row report: status plus link or error for every input row
+    report = io.StringIO()
+    writer = csv.writer(report)
+    writer.writerow(["row", "status", "url", "error"])
+    for i in range(len(rows)):
+        if i in errors:
+            writer.writerow([i + 1, "failed", "", errors[i]])
+        else:
+            writer.writerow([i + 1, "ok", f"{BASE_URL}/{outputs[i]}", ""])
+    files = [discord.File(io.BytesIO(report.getvalue().encode("utf-8")), filename="bulk_report.csv")]
+
+    summary = f"✅ Rendered {len(rendered)}/{len(rows)} documents from '{template_name}'."
+    if errors:
+        summary += f" ❌ {len(errors)} failed (see report)."
+
+    if output == "zip" and rendered:
+        zip_path = os.path.join(artifacts.root, f"bulk_{interaction.user.id}_{int(datetime.now().timestamp())}.zip")
+        with span("write zip"):
+            await asyncio.to_thread(write_zip, zip_path, [(outputs[i], f"{i + 1:04d}.docx") for i in rendered])
+        summary += f"\nDownload: {BASE_URL}/{zip_path}"
+        if os.path.getsize(zip_path) <= interaction.guild.filesize_limit - len(report.getvalue()):
+            files.append(discord.File(zip_path))
+
+    await progress_msg.edit(content=summary, attachments=files)
+    log_action(f"{interaction.user} bulk generated {len(rendered)} documents from '{template_name}'")
 
 import json
-import aiohttp
 import asyncio
 import discord
 
@@ -233,7 +504,7 @@ async def create_dm_template(interaction: discord.Interaction):
         template_name = name_msg.content
         save_dm_template(template_name, content, fields)
         await dm_channel.send(f"DM template '{template_name}' saved with fields: {fields}")
-        await log_action(bot, f"{interaction.user} created DM template '{template_name}'")
+        log_action(f"{interaction.user} created DM template '{template_name}'")
     except asyncio.TimeoutError:
         await dm_channel.send("Timeout. Template creation cancelled.")
 
@@ -241,12 +512,11 @@ async def create_dm_template(interaction: discord.Interaction):
 async def list_dm_templates(interaction: discord.Interaction):
     if not await require_role(interaction, ROLE_DM_PERMISSIONS):
         return
-    with open("dm_templates.json", "r") as f:
-        templates = json.load(f)
-    if not templates:
+    names = dm_templates.names()
+    if not names:
         await interaction.response.send_message("No DM templates found.", ephemeral=True)
         return
-    await interaction.response.send_message("📑 DM Templates:\n" + "\n".join(templates.keys()), ephemeral=True)
+    await interaction.response.send_message("📑 DM Templates:\n" + "\n".join(names), ephemeral=True)
 
 @bot.tree.command(name="send_dm", description="Send a DM to a user using a saved template", guild=discord.Object(id=GUILD_ID))
 @app_commands.describe(template_name="The DM template to use", user="User to send the DM to")
@@ -257,13 +527,11 @@ async def send_dm(interaction: discord.Interaction, template_name: str, user: di
         await interaction.response.send_message("❌ You do not have permission to use this command.", ephemeral=True)
         return
 
-    with open("dm_templates.json", "r") as f:
-        templates = json.load(f)
-    if template_name not in templates:
+    template = dm_templates.get(template_name)
+    if template is None:
         await interaction.response.send_message("❌ Template not found.", ephemeral=True)
         return
 
-    template = templates[template_name]
     fields = template["fields"]
     content = template["content"]
 
@@ -291,28 +559,87 @@ async def send_dm(interaction: discord.Interaction, template_name: str, user: di
         target_dm = await user.create_dm()
         await target_dm.send(final_message)
         await interaction.response.send_message(f"✅ DM sent to {user.display_name}.", ephemeral=True)
-        await log_action(bot, f"{interaction.user} sent DM to {user} using template '{template_name}'")
+        log_action(f"{interaction.user} sent DM to {user} using template '{template_name}'")
     except:
         await interaction.response.send_message("❌ Could not send DM (user may have DMs closed).", ephemeral=True)
 
-# ---------------------------
-# Embed Template Handling
-# ---------------------------
-EMBED_TEMPLATES_FILE = "embed_templates.json"
-if not os.path.exists(EMBED_TEMPLATES_FILE):
-    with open(EMBED_TEMPLATES_FILE, "w") as f:
-        json.dump({}, f)
+@bot.tree.command(name="send_dm_role", description="DM every member of a role using a saved template", guild=discord.Object(id=GUILD_ID))
+@app_commands.describe(template_name="The DM template to use", role="Role whose members will receive the DM")
+async def send_dm_role(interaction: discord.Interaction, template_name: str, role: discord.Role):
+    if not await require_role(interaction, ROLE_DM_PERMISSIONS):
+        return
+    if not interaction.user.guild_permissions.manage_messages and not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ You do not have permission to use this command.", ephemeral=True)
+        return
+
+    template = dm_templates.get(template_name)
+    if template is None:
+        await interaction.response.send_message("❌ Template not found.", ephemeral=True)
+        return
 
-def save_embed_template(name, data):
-    with open(EMBED_TEMPLATES_FILE, "r") as f:
-        templates = json.load(f)
-    templates[name] = data
-    with open(EMBED_TEMPLATES_FILE, "w") as f:
-        json.dump(templates, f, indent=4)
+    recipients = [m for m in role.members if not m.bot]
+    if not recipients:
+        await interaction.response.send_message(f"❌ {role.mention} has no members to DM.", ephemeral=True)
+        return
+    await interaction.response.send_message(
+        f"Filling '{template_name}' for {len(recipients)} members of {role.mention}. Check your DMs!", ephemeral=True
+    )
+
+    fields = template["fields"]
+    content = template["content"]
+
+    dm_channel = await interaction.user.create_dm()
+    await dm_channel.send(f"Please provide the following fields for template '{template_name}': {fields}")
+
+    responses = {}
+    def dm_check(m):
+        return m.author == interaction.user and isinstance(m.channel, discord.DMChannel)
+
+    for field in fields:
+        await dm_channel.send(f"Enter value for {field}:")
+        try:
+            msg = await bot.wait_for("message", check=dm_check, timeout=300)
+            responses[field] = msg.content
+        except asyncio.TimeoutError:
+            await dm_channel.send("Timeout waiting for input.")
+            return
 
-def load_embed_templates():
-    with open(EMBED_TEMPLATES_FILE, "r") as f:
-        return json.load(f)
+    final_message = content
+    for k, v in responses.items():
+        final_message = final_message.replace(f"{{{{{k}}}}}", v)
+
+    # Queue one DM per member; the status message below is edited with live counts
+    status_msg = await dm_channel.send(f"📨 Queued {len(recipients)} DMs for {role.mention}…")
+    campaign_id = dm_campaigns.create(template_name, final_message, role, interaction.user, status_msg)
+    log_action(f"{interaction.user} started DM campaign `{campaign_id}` to {role.name} using template '{template_name}'")
+
+    counts = await dm_campaigns.start(campaign_id)
+    if counts is None:
+        return  # stopped by shutdown; resumes on the next start
+    log_action(
+        f"DM campaign `{campaign_id}` finished: {counts['sent']} sent, {counts['closed']} DMs closed, {counts['failed']} failed"
+    )
+
+@bot.tree.command(name="dm_campaigns", description="Show progress of recent DM campaigns", guild=discord.Object(id=GUILD_ID))
+async def list_dm_campaigns(interaction: discord.Interaction):
+    if not await require_role(interaction, ROLE_DM_PERMISSIONS):
+        return
+    campaign_ids = sorted(dm_campaigns.store.names(), key=lambda cid: dm_campaigns.store.get(cid)["created"])[-10:]
+    if not campaign_ids:
+        await interaction.response.send_message("No DM campaigns found.", ephemeral=True)
+        return
+    lines = [dm_campaigns.status_text(cid) for cid in reversed(campaign_ids)]
+    await interaction.response.send_message("\n".join(lines)[:2000], ephemeral=True)
+
+# ---------------------------
+# Container Templates
+# ---------------------------
+# Stored in the embed_templates collection; each one is validated and
+# serialized once and gets its own slash command (see below).
+container_templates = ContainerTemplates(embed_templates)
+if db.get_meta("container_templates_seeded") is None:
+    container_templates.seed(DEFAULT_CONTAINERS)
+    db.set_meta("container_templates_seeded", "1")
 
 
 # ---------------------------
@@ -331,9 +658,7 @@ class AnnouncementView(discord.ui.View):
             await interaction.response.send_message("You can't approve this!", ephemeral=True)
             return
         await self.channel.send(content="@everyone", embed=self.embed)
-        log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
-        if log_channel:
-            await log_channel.send(f"✅ Announcement approved by {self.user} and posted in {self.channel.mention}.")
+        audit_log.log(f"✅ Announcement approved by {self.user} and posted in {self.channel.mention}.")
         await interaction.response.edit_message(content="Announcement posted successfully!", view=None)
 
     @discord.ui.button(label="Deny", style=discord.ButtonStyle.red)
@@ -341,9 +666,7 @@ class AnnouncementView(discord.ui.View):
         if interaction.user != self.user:
             await interaction.response.send_message("You can't deny this!", ephemeral=True)
             return
-        log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
-        if log_channel:
-            await log_channel.send(f"❌ Announcement denied by {self.user}. Process cancelled.")
+        audit_log.log(f"❌ Announcement denied by {self.user}. Process cancelled.")
         await interaction.response.edit_message(content="Announcement cancelled.", view=None)
 
 # ---------------------------
@@ -357,23 +680,36 @@ class AnnouncementView(discord.ui.View):
     description="Send an announcement using the template as a container",
     guild=discord.Object(id=GUILD_ID)
 )
-@app_commands.describe(channel="Announcement channel to post in")
-async def announcement(interaction: discord.Interaction, channel: discord.TextChannel):
+@app_commands.describe(channel="Announcement channel to post in", output_format="How the letter should be linked", **BROADCAST_DESCRIBE)
+@app_commands.choices(output_format=OUTPUT_FORMATS)
+async def announcement(
+    interaction: discord.Interaction,
+    channel: discord.TextChannel = None,
+    output_format: str = "docx",
+    channels: str = None,
+    category: discord.CategoryChannel = None,
+):
     if not await require_role(interaction, ROLE_ANNOUNCEMENT):
         return
 
+    targets, skipped = await resolve_channels(interaction.guild, channel, channels, category)
+    if not targets:
+        await interaction.response.send_message(
+            "❌ Pick a channel, a list of channels or a category." + describe_skipped(skipped), ephemeral=True
+        )
+        return
+
     await interaction.response.send_message("Filling announcement template. Check your DMs.", ephemeral=True)
 
     # Load template
-    with open("templates.json", "r") as f:
-        templates = json.load(f)
-    if "announcement" not in templates:
+    template = docx_templates.get("announcement")
+    if template is None:
         await interaction.followup.send(
             "Announcement template not found. Use /update_anntemplate first.", ephemeral=True
         )
         return
 
-    fields = templates["announcement"]["fields"]
+    fields = template["fields"]
 
     # Ask user for all fields
     try:
@@ -389,11 +725,10 @@ async def announcement(interaction: discord.Interaction, channel: discord.TextCh
         return
 
     # Render DOCX
-    doc = DocxTemplate(templates["announcement"]["file_path"])
-    doc.render(responses)
-    output_docx = f"generated/{interaction.user.id}_announcement.docx"
-    doc.save(output_docx)
-    view_url = f"https://view.officeapps.live.com/op/embed.aspx?src={BASE_URL}/generated/{os.path.basename(output_docx)}"
+    output_docx = await render_or_report(dm_channel, template["file_path"], responses, output_format)
+    if output_docx is None:
+        return
+    view_url = document_url(output_docx, output_format)
 
     # Prepare announcement text
     subject = responses.get("Subject", "Announcement")
@@ -426,24 +761,10 @@ async def announcement(interaction: discord.Interaction, channel: discord.TextCh
 }
 
 
-    url = f"https://discord.com/api/v10/channels/{channel.id}/messages"
-    headers = {
-        "Authorization": f"Bot {os.environ['DISCORD_TOKEN']}",
-        "Content-Type": "application/json"
-    }
+    await dm_channel.send(await broadcast_container(targets, payload, "Announcement container", skipped))
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=payload) as resp:
-            text = await resp.text()
-            if resp.status in (200, 201):
-                await dm_channel.send(f"✅ Announcement container sent to {channel.mention}")
-            else:
-                await dm_channel.send(f"❌ Failed to send container: {resp.status} {text}")
-
-    # Optional logging
-    log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
-    if log_channel:
-        await log_channel.send(f"📝 Announcement container sent by {interaction.user} to {channel.mention}")
+    mentions = ", ".join(c.mention for c in targets)
+    audit_log.log(f"📝 Announcement container sent by {interaction.user} to {mentions}")
 
 
 # ---------------------------
@@ -467,13 +788,13 @@ async def update_anntemplate(interaction: discord.Interaction):
     file = msg.attachments[0]
     file_ext = os.path.splitext(file.filename)[1]
     file_path = f"templates/{interaction.user.id}_announcement{file_ext}"
-    await file.save(file_path)
-
-    fields = extract_fields(file_path)
+    with span("save template"):
+        await save_upload(file, file_path)
+        fields = extract_fields(file_path)
     save_template("announcement", file_path, fields)
 
     await interaction.followup.send(f"Announcement template updated with fields: {fields}", ephemeral=True)
-    await log_action(bot, f"{interaction.user} updated announcement template")
+    log_action(f"{interaction.user} updated announcement template")
 
 @bot.tree.command(name="msg", description="Send a plain message to a channel", guild=discord.Object(id=GUILD_ID))
 @app_commands.describe(
@@ -528,7 +849,7 @@ async def kick(interaction: discord.Interaction, user: discord.Member, reason: s
     try:
         await user.kick(reason=reason)
         await interaction.response.send_message(f"✅ {user.mention} has been kicked. Reason: {reason}", ephemeral=True)
-        await log_action(bot, f"{interaction.user} kicked {user} ({reason})")
+        log_action(f"{interaction.user} kicked {user} ({reason})")
     except Exception as e:
         await interaction.response.send_message(f"❌ Failed to kick {user}. Error: {e}", ephemeral=True)
 
@@ -542,24 +863,14 @@ async def ban(interaction: discord.Interaction, user: discord.Member, reason: st
     try:
         await user.ban(reason=reason)
         await interaction.response.send_message(f"✅ {user.mention} has been banned. Reason: {reason}", ephemeral=True)
-        await log_action(bot, f"{interaction.user} banned {user} ({reason})")
+        log_action(f"{interaction.user} banned {user} ({reason})")
     except Exception as e:
         await interaction.response.send_message(f"❌ Failed to ban {user}. Error: {e}", ephemeral=True)
 
 
-# We’ll store warnings in a JSON file
-WARN_FILE = "warnings.json"
-if not os.path.exists(WARN_FILE):
-    with open(WARN_FILE, "w") as f:
-        json.dump({}, f)
-
-def load_warnings():
-    with open(WARN_FILE, "r") as f:
-        return json.load(f)
-
-def save_warnings(data):
-    with open(WARN_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+# Warnings are a table in the bot database (indexed by user and time)
+warnings_store = WarningsStore(db)
+WARNINGS_PAGE_SIZE = 10
 
 
 @bot.tree.command(name="warn", description="Warn a user", guild=discord.Object(id=GUILD_ID))
@@ -569,13 +880,7 @@ async def warn(interaction: discord.Interaction, user: discord.Member, reason: s
         await interaction.response.send_message("❌ You don’t have permission to warn members.", ephemeral=True)
         return
 
-    warnings = load_warnings()
-    user_id = str(user.id)
-
-    if user_id not in warnings:
-        warnings[user_id] = []
-    warnings[user_id].append({"moderator": str(interaction.user), "reason": reason, "time": str(datetime.utcnow())})
-    save_warnings(warnings)
+    await warnings_store.add(user.id, str(interaction.user), interaction.user.id, reason, str(datetime.utcnow()))
 
     try:
         await user.send(f"⚠️ You have been warned in **{interaction.guild.name}**. Reason: {reason}")
@@ -583,7 +888,63 @@ async def warn(interaction: discord.Interaction, user: discord.Member, reason: s
         pass  # User might have DMs closed
 
     await interaction.response.send_message(f"✅ {user.mention} has been warned. Reason: {reason}", ephemeral=True)
-    await log_action(bot, f"{interaction.user} warned {user} ({reason})")
+    log_action(f"{interaction.user} warned {user} ({reason})")
+
+
+@bot.tree.command(name="warnings", description="Show a member's warning history", guild=discord.Object(id=GUILD_ID))
+@app_commands.describe(
+    user="Member whose warnings to show",
+    moderator="Only warnings issued by this moderator",
+    since="Only warnings on or after this date (YYYY-MM-DD)",
+    until="Only warnings on or before this date (YYYY-MM-DD)",
+    page="Page number"
+)
+async def warnings_history(
+    interaction: discord.Interaction,
+    user: discord.User,
+    moderator: discord.Member = None,
+    since: str = None,
+    until: str = None,
+    page: app_commands.Range[int, 1] = 1,
+):
+    if not interaction.user.guild_permissions.manage_messages:
+        await interaction.response.send_message("❌ You don’t have permission to view warnings.", ephemeral=True)
+        return
+
+    try:
+        since_key = datetime.strptime(since, "%Y-%m-%d").strftime("%Y-%m-%d") if since else None
+        until_key = (datetime.strptime(until, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d") if until else None
+    except ValueError:
+        await interaction.response.send_message("❌ Dates must look like 2025-09-01.", ephemeral=True)
+        return
+
+    rows, total = await warnings_store.history(
+        user.id,
+        moderator=str(moderator) if moderator else None,
+        moderator_id=moderator.id if moderator else None,
+        since=since_key,
+        until=until_key,
+        limit=WARNINGS_PAGE_SIZE,
+        offset=(page - 1) * WARNINGS_PAGE_SIZE,
+    )
+    if not total:
+        await interaction.response.send_message(f"No warnings found for {user.mention}.", ephemeral=True)
+        return
+
+    pages = (total + WARNINGS_PAGE_SIZE - 1) // WARNINGS_PAGE_SIZE
+    if not rows:
+        await interaction.response.send_message(f"❌ There are only {pages} page(s) of warnings.", ephemeral=True)
+        return
+
+    embed = discord.Embed(title=f"Warnings for {user}", color=DARK_BLUE)
+    for row in rows:
+        embed.add_field(
+            name=f"#{row['id']} • {row['created_at'][:16]} UTC • by {row['moderator']}",
+            value=row["reason"][:1024] or "*[No reason]*",
+            inline=False
+        )
+    embed.set_footer(text=f"Page {page}/{pages} • {total} warning(s)")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
 
 @bot.tree.command(name="timeout", description="Timeout a user for a given duration", guild=discord.Object(id=GUILD_ID))
@@ -598,7 +959,7 @@ async def timeout(interaction: discord.Interaction, user: discord.Member, durati
         await interaction.response.send_message(
             f"✅ {user.mention} has been timed out for {duration} minutes. Reason: {reason}", ephemeral=True
         )
-        await log_action(bot, f"{interaction.user} timed out {user} ({reason}, {duration}m)")
+        log_action(f"{interaction.user} timed out {user} ({reason}, {duration}m)")
     except Exception as e:
         await interaction.response.send_message(f"❌ Failed to timeout {user}. Error: {e}", ephemeral=True)
 
@@ -608,19 +969,8 @@ async def timeout(interaction: discord.Interaction, user: discord.Member, durati
 
 MODMAIL_CATEGORY_ID = 1408849860202860594  # category where tickets go
 SENIOR_LEADERSHIP_ROLE = 1410288467782533270  # role allowed to see tickets
-MODMAIL_FILE = "modmail_tickets.json"
-
-if not os.path.exists(MODMAIL_FILE):
-    with open(MODMAIL_FILE, "w") as f:
-        json.dump({}, f)
-
-def load_modmail():
-    with open(MODMAIL_FILE, "r") as f:
-        return json.load(f)
-
-def save_modmail(data):
-    with open(MODMAIL_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+# Both directions (user -> ticket channel, channel -> user) kept in memory
+tickets = TicketIndex(db)
 
 
 @bot.event
@@ -632,8 +982,7 @@ async def on_message(message):
     # User DMs the bot
     # ---------------------------
     if isinstance(message.channel, discord.DMChannel):
-        tickets = load_modmail()
-        user_id = str(message.author.id)
+        user_id = message.author.id
         guild = bot.get_guild(GUILD_ID)
 
         # Only open ticket if user says HELP
@@ -650,50 +999,44 @@ async def on_message(message):
             channel = await category.create_text_channel(name=f"ticket-{message.author.name}", overwrites=overwrites)
 
 
-            tickets[user_id] = channel.id
-            save_modmail(tickets)
+            tickets.open(message.author, channel.id)
 
             await message.channel.send("📬 Thank you! Your query has been submitted. Senior Leadership will contact you shortly.")
             await channel.send(f"📩 New Modmail from {message.author.mention} ({message.author.id})")
 
         else:
-            channel = guild.get_channel(tickets[user_id])
+            channel_id = tickets.channel_for(user_id)
+            channel = guild.get_channel(channel_id) if channel_id else None
 
         if channel:
             embed = discord.Embed(description=message.content or "*[No text]*", color=DARK_BLUE)
             embed.set_author(name=f"{message.author}", icon_url=message.author.display_avatar.url)
-            await channel.send(embed=embed)
 
-            # Forward attachments
-            for attachment in message.attachments:
-                await channel.send(f"📎 Attachment from {message.author}:", file=await attachment.to_file())
+            # Embed + attachments in as few messages as possible
+            await relay_message(
+                channel, message.attachments, bot.rest, guild.filesize_limit,
+                embed=embed, label=f"📎 Attachment from {message.author}:"
+            )
 
 
     # ---------------------------
     # Staff replies in ticket channel with /r
     # ---------------------------
     elif message.channel.category_id == MODMAIL_CATEGORY_ID and message.content.startswith("/r "):
-        tickets = load_modmail()
+        user_id = tickets.user_for(message.channel.id)
+        if user_id is None:
+            return
         reply_text = message.content[3:].strip()
+        user = await tickets.resolve_user(bot, user_id)
 
-        for user_id, channel_id in tickets.items():
-            if channel_id == message.channel.id:
-                user = await bot.fetch_user(int(user_id))
+        embed = discord.Embed(description=reply_text or "*[No text]*", color=DARK_BLUE)
+        embed.set_author(name=f"{message.author} (Senior Leadership)", icon_url=message.author.display_avatar.url)
 
-                embed = discord.Embed(description=reply_text or "*[No text]*", color=DARK_BLUE)
-                embed.set_author(name=f"{message.author} (Senior Leadership)", icon_url=message.author.display_avatar.url)
-
-                try:
-                    await user.send(embed=embed)
-
-                    # Forward attachments if any
-                    for attachment in message.attachments:
-                        await user.send(file=await attachment.to_file())
-
-                    await message.channel.send(f"✅ Reply sent to {user.mention}")
-                except:
-                    await message.channel.send("❌ Could not DM user.")
-                break
+        try:
+            await relay_message(user, message.attachments, bot.rest, embed=embed)
+            await message.channel.send(f"✅ Reply sent to {user.mention}")
+        except:
+            await message.channel.send("❌ Could not DM user.")
 
 
 # ---------------------------
@@ -702,21 +1045,18 @@ async def on_message(message):
 @bot.tree.command(name="close", description="Close a modmail ticket", guild=discord.Object(id=GUILD_ID))
 @app_commands.describe(user="User whose ticket you want to close")
 async def close_modmail(interaction: discord.Interaction, user: discord.User):
-    tickets = load_modmail()
-    user_id = str(user.id)
+    channel_id = tickets.channel_for(user.id)
 
-    if user_id not in tickets:
+    if channel_id is None:
         await interaction.response.send_message("❌ That user does not have an open ticket.", ephemeral=True)
         return
 
-    channel_id = tickets[user_id]
     channel = interaction.guild.get_channel(channel_id)
 
     if channel:
         await channel.delete()
 
-    del tickets[user_id]
-    save_modmail(tickets)
+    tickets.close(user.id)
 
     try:
         dm = await user.create_dm()
@@ -725,7 +1065,7 @@ async def close_modmail(interaction: discord.Interaction, user: discord.User):
         pass
 
     await interaction.response.send_message(f"✅ Closed modmail ticket for {user.mention}.", ephemeral=True)
-    await log_action(bot, f"{interaction.user} closed modmail for {user}")
+    log_action(f"{interaction.user} closed modmail for {user}")
 
 @bot.tree.command(
     name="send_jsonfile_dynamic",
@@ -744,13 +1084,12 @@ async def send_jsonfile_dynamic(interaction: discord.Interaction, channel: disco
     # Defer to give user time
     await interaction.response.defer(ephemeral=True)
 
+    files = []
     try:
-        # Load JSON
+        # Load JSON, validate it and collect attachment:// references in one pass
         raw = await json_file.read()
         payload = json.loads(raw.decode("utf-8"))
-
-        # Find attachment:// references
-        attachment_filenames = set(re.findall(r"attachment://([\w\-. ()]+)", json.dumps(payload)))
+        attachment_filenames = scan_message_payload(payload)
         uploaded_files = {}
 
         if attachment_filenames:
@@ -763,50 +1102,46 @@ async def send_jsonfile_dynamic(interaction: discord.Interaction, channel: disco
             def normalize(name):
                 return re.sub(r"[\s_]", "", name.lower())
 
+            wanted = {normalize(fn): fn for fn in attachment_filenames}
+
             def check(m):
                 return (
                     m.author.id == interaction.user.id and
-                    any(normalize(a.filename) in [normalize(fn) for fn in attachment_filenames] for a in m.attachments)
+                    any(normalize(a.filename) in wanted for a in m.attachments)
                 )
 
-
             try:
                 msg = await bot.wait_for("message", check=check, timeout=300)
+                # Key by the name the JSON references so attachment:// resolves
                 for a in msg.attachments:
-                    if a.filename in attachment_filenames:
-                        uploaded_files[a.filename] = a
+                    if normalize(a.filename) in wanted:
+                        uploaded_files[wanted[normalize(a.filename)]] = a
             except asyncio.TimeoutError:
                 await interaction.followup.send("❌ Timeout waiting for required attachments. Command cancelled.")
                 return
 
-        # Build form-data request
-        form = aiohttp.FormData()
-        form.add_field("payload_json", json.dumps(payload))
-
-        for i, filename in enumerate(uploaded_files):
-            f = uploaded_files[filename]
-            data = await f.read()
-            form.add_field(
-                f"files[{i}]",
-                data,
-                filename=f.filename,
-                content_type=f.content_type or "application/octet-stream"
-            )
-
-        # Send to Discord API
-        url = f"https://discord.com/api/v10/channels/{channel.id}/messages"
-        headers = {"Authorization": f"Bot {os.environ['DISCORD_TOKEN']}"}
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, data=form) as resp:
-                if resp.status in (200, 201):
-                    await interaction.followup.send(f"✅ JSON message sent to {channel.mention}")
-                else:
-                    err = await resp.text()
-                    await interaction.followup.send(f"❌ Failed ({resp.status}): {err}")
+        # Fetch every file in parallel into spooled temp files; they're streamed
+        # into the multipart body, so large banners never sit fully in memory
+        fps = await asyncio.gather(*(bot.rest.download(a.url) for a in uploaded_files.values()), return_exceptions=True)
+        for (filename, a), fp in zip(uploaded_files.items(), fps):
+            if not isinstance(fp, Exception):
+                files.append((filename, a.content_type or "application/octet-stream", fp))
+        for fp in fps:
+            if isinstance(fp, Exception):
+                raise fp
+
+        # Send to Discord API (the form is rebuilt if the client has to retry)
+        resp = await bot.rest.send_message(channel.id, data=build_multipart(payload, files))
+        if resp.ok:
+            await interaction.followup.send(f"✅ JSON message sent to {channel.mention}")
+        else:
+            await interaction.followup.send(f"❌ Failed ({resp.status}): {resp.text}")
 
     except Exception as e:
         await interaction.followup.send(f"❌ Error processing JSON file: {e}")
+    finally:
+        for _, _, fp in files:
+            fp.close()
 
 @bot.tree.command(
     name="embed",
@@ -843,14 +1178,17 @@ async def embed(interaction: discord.Interaction):
         await dm.send("⏰ Timed out. Restart command.")
         return
 
-    # Ask for channel
-    await dm.send("Enter the channel ID:")
+    # Ask for channel(s)
+    await dm.send("Enter the channel ID (or several IDs / a category ID, separated by spaces):")
     try:
         msg = await bot.wait_for("message", timeout=60.0, check=check)
-        channel_id = int(msg.content.strip())
-    except (asyncio.TimeoutError, ValueError):
+    except asyncio.TimeoutError:
         await dm.send("❌ Invalid channel ID. Restart command.")
         return
+    targets, skipped = await resolve_channels(interaction.guild, channels=msg.content)
+    if not targets:
+        await dm.send("❌ No channel I can post in. Restart command." + describe_skipped(skipped))
+        return
 
      # Discohook-style payload
     brief = {
@@ -872,238 +1210,255 @@ async def embed(interaction: discord.Interaction):
     ]
 }
 
-    url = f"https://discord.com/api/v10/channels/{channel_id}/messages"
-    headers = {
-        "Authorization": f"Bot {os.environ['DISCORD_TOKEN']}",
-        "Content-Type": "application/json"
-    }
+    await interaction.followup.send(await broadcast_container(targets, brief, skipped=skipped))
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=brief) as resp:
-            text = await resp.text()
-            if resp.status in (200, 201):
-                await interaction.followup.send(f"✅ Container sent to <#{channel_id}>")
-            else:
-                await interaction.followup.send(f"❌ Failed to send container: {resp.status} {text}")
+# ---------------------------
+# Container template commands
+# ---------------------------
+# One slash command per stored container template (e.g. /staffjoin,
+# /briefing, /session). Sending posts the template's cached bytes.
+def container_command(name):
+    @app_commands.describe(channel="Channel to send the container to", **BROADCAST_DESCRIBE)
+    async def send_container(
+        interaction: discord.Interaction,
+        channel: discord.TextChannel = None,
+        channels: str = None,
+        category: discord.CategoryChannel = None,
+    ):
+        if not await require_role(interaction, ROLE_DOCUMENT_MANAGER):
+            return
 
-@bot.tree.command(
-    name="staffjoin",
-    description="Trigger staff join.",
-    guild=discord.Object(id=GUILD_ID)
+        body = container_templates.body(name)
+        if body is None:
+            await interaction.response.send_message(f"❌ Container template '{name}' no longer exists.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        targets, skipped = await resolve_channels(interaction.guild, channel, channels, category)
+        if not targets:
+            await interaction.followup.send(
+                "❌ Pick a channel, a list of channels or a category." + describe_skipped(skipped), ephemeral=True
+            )
+            return
+
+        await interaction.followup.send(await broadcast_container(targets, body, skipped=skipped))
+        log_action(f"{interaction.user} sent container '{name}' to {len(targets)} channel(s)")
+
+    return app_commands.Command(name=name, description=container_templates.description(name), callback=send_container)
+
+
+container_commands = set()
+
+def register_container_command(name):
+    guild = discord.Object(id=GUILD_ID)
+    if name in container_commands:
+        bot.tree.remove_command(name, guild=guild)
+    elif bot.tree.get_command(name, guild=guild) is not None:
+        return False
+    bot.tree.add_command(container_command(name), guild=guild)
+    container_commands.add(name)
+    return True
+
+
+async def container_template_names(interaction: discord.Interaction, current: str):
+    return [
+        app_commands.Choice(name=n, value=n) for n in container_templates.names() if current.lower() in n
+    ][:25]
+
+
+@bot.tree.command(name="container_template", description="Add or replace a container template command", guild=discord.Object(id=GUILD_ID))
+@app_commands.describe(
+    name="Command name (lowercase, no spaces)",
+    payload="Discohook / Components V2 JSON export",
+    description="Description shown in the slash command menu",
 )
-@app_commands.describe(channel="Channel to send the container to")
-async def send_sample_container(interaction: discord.Interaction, channel: discord.TextChannel):
+async def add_container_template(
+    interaction: discord.Interaction, name: str, payload: discord.Attachment, description: str = None
+):
     if not await require_role(interaction, ROLE_DOCUMENT_MANAGER):
         return
-
     await interaction.response.defer(ephemeral=True)
 
-    # Discohook-style payload
-    staffj = {
-  "flags": 32768,
-  "components": [
-    {
-      "type": 10,
-      "content": "@everyone"
-    },
-    {
-      "type": 17,
-      "components": [
-        {
-          "type": 12,
-          "items": [
-            {
-              "media": {
-                "url": "https://media.discordapp.net/attachments/1411299414869282847/1411759919241363527/Banners_11.png?ex=68b5d361&is=68b481e1&hm=95ceabba5571b5baf6bad6f9efe6c89ace8c0f66e659b9c5f4e043b9861c64fd&=&format=webp&quality=lossless"
-              }
-            }
-          ]
-        },
-        {
-          "type": 9,
-          "components": [
-            {
-              "type": 10,
-              "content": "# Staff Join\nGreeting team, it is now time for you to begin joining our campus in preparation for the session to begin. A reminder to equip your lanyard, radio and hivis jacket if required. If you have claimed a classroom, please setup that classroom as you desire. \n\nFailure to attend when you have claimed a classroom or duties will result in an immediate strike from the Human Resources Department."
-            }
-          ],
-          "accessory": {
-            "type": 2,
-            "style": 5,
-            "label": "Join!",
-            "url": "https://www.roblox.com/games/83329354034194/Thornvale",
-          }
-        }
-      ]
-    }
-  ]
-}
-  
-
-    url = f"https://discord.com/api/v10/channels/{channel.id}/messages"
-    headers = {
-        "Authorization": f"Bot {os.environ['DISCORD_TOKEN']}",
-        "Content-Type": "application/json"
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=staffj) as resp:
-            text = await resp.text()
-            if resp.status in (200, 201):
-                await interaction.followup.send(f"✅ Container sent to {channel.mention}")
-            else:
-                await interaction.followup.send(f"❌ Failed to send container: {resp.status} {text}")
-           
-                
-@bot.tree.command(
-    name="briefing",
-    description="Trigger staff weekly briefing.",
-    guild=discord.Object(id=GUILD_ID)
-)
-@app_commands.describe(channel="Channel to send the container to")
-async def send_sample_container(interaction: discord.Interaction, channel: discord.TextChannel):
+    name = name.lower()
+    guild = discord.Object(id=GUILD_ID)
+    if name not in container_commands and bot.tree.get_command(name, guild=guild) is not None:
+        await interaction.followup.send(f"❌ /{name} is already a built-in command.")
+        return
+    try:
+        container_templates.set(name, json.loads((await payload.read()).decode("utf-8")), description)
+    except ValueError as e:
+        await interaction.followup.send(f"❌ Invalid container template: {e}")
+        return
+
+    register_container_command(name)
+    await bot.sync_commands()
+    await interaction.followup.send(f"✅ Container template saved; use /{name} to send it.")
+    log_action(f"{interaction.user} saved container template '{name}'")
+
+
+@bot.tree.command(name="container_template_remove", description="Remove a container template command", guild=discord.Object(id=GUILD_ID))
+@app_commands.autocomplete(name=container_template_names)
+async def remove_container_template(interaction: discord.Interaction, name: str):
     if not await require_role(interaction, ROLE_DOCUMENT_MANAGER):
         return
+    if not container_templates.delete(name):
+        await interaction.response.send_message(f"❌ No container template named '{name}'.", ephemeral=True)
+        return
 
     await interaction.response.defer(ephemeral=True)
+    if name in container_commands:
+        bot.tree.remove_command(name, guild=discord.Object(id=GUILD_ID))
+        container_commands.discard(name)
+    await bot.sync_commands()
+    await interaction.followup.send(f"🗑️ Container template '{name}' and /{name} removed.")
+    log_action(f"{interaction.user} removed container template '{name}'")
 
-    # Discohook-style payload
-    brief = {
-  "flags": 32768,
-  "components": [
-    {
-      "type": 10,
-      "content": "@everyone"
-    },
-    {
-      "type": 17,
-      "components": [
-        {
-          "type": 12,
-          "items": [
-            {
-              "media": {
-                "url": "https://media.discordapp.net/attachments/1411299414869282847/1411759919241363527/Banners_11.png?ex=68b5d361&is=68b481e1&hm=95ceabba5571b5baf6bad6f9efe6c89ace8c0f66e659b9c5f4e043b9861c64fd&=&format=webp&quality=lossless"
-              }
-            }
-          ]
-        },
-        {
-          "type": 9,
-          "components": [
-            {
-              "type": 10,
-              "content": "# Staff Join\nGreeting team, it is now time for you to begin joining our campus in preparation for the session to begin. A reminder to equip your lanyard, radio and hivis jacket if required. If you have claimed a classroom, please setup that classroom as you desire. \n\nFailure to attend when you have claimed a classroom or duties will result in an immediate strike from the Human Resources Department."
-            }
-          ],
-          "accessory": {
-            "type": 2,
-            "style": 5,
-            "label": "Join!",
-            "url": "https://www.roblox.com/games/83329354034194/Thornvale",
-          }
-        }
-      ]
-    }
-  ]
-}
-  
-
-    url = f"https://discord.com/api/v10/channels/{channel.id}/messages"
-    headers = {
-        "Authorization": f"Bot {os.environ['DISCORD_TOKEN']}",
-        "Content-Type": "application/json"
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=brief) as resp:
-            text = await resp.text()
-            if resp.status in (200, 201):
-                await interaction.followup.send(f"✅ Container sent to {channel.mention}")
-            else:
-                await interaction.followup.send(f"❌ Failed to send container: {resp.status} {text}")
 
-@bot.tree.command(
-    name="session",
-    description="Trigger session announcement.",
-    guild=discord.Object(id=GUILD_ID)
+# ---------------------------
+# Scheduled container sends
+# ---------------------------
+async def send_scheduled(template, channel_ids):
+    body = container_templates.body(template)
+    if body is None:
+        raise ValueError(f"container template '{template}' no longer exists")
+    results = await bot.rest.broadcast(channel_ids, body)
+    sent = sum(1 for r in results if not isinstance(r, Exception) and r.ok)
+    return f"sent to {sent}/{len(channel_ids)} channel(s)"
+
+scheduler = AnnouncementScheduler(db.collection("schedules"), send_scheduled, log=log_action)
+
+SCHEDULE_RECURRENCES = [app_commands.Choice(name=label, value=value) for value, label in RECURRENCES.items()]
+
+
+async def schedule_ids(interaction: discord.Interaction, current: str):
+    return [
+        app_commands.Choice(name=f"{sid} · {r['template']} · {r['time']} {r['recurrence']}", value=sid)
+        for sid, r in scheduler.jobs() if current in sid or current in r["template"]
+    ][:25]
+
+
+def describe_schedule(schedule_id, record):
+    channels = ", ".join(f"<#{c}>" for c in record["channel_ids"][:5])
+    if len(record["channel_ids"]) > 5:
+        channels += f" +{len(record['channel_ids']) - 5} more"
+    line = (
+        f"`{schedule_id}` **{record['template']}** → {channels} · {RECURRENCES[record['recurrence']]} at "
+        f"{record['time']} · next <t:{int(record['next_run'])}:F> (<t:{int(record['next_run'])}:R>)"
+    )
+    if record.get("last_status"):
+        line += f" · last: {record['last_status']}"
+    return line
+
+
+@bot.tree.command(name="schedule_add", description="Schedule a container template to be sent automatically", guild=discord.Object(id=GUILD_ID))
+@app_commands.describe(
+    template="Container template to send",
+    time="Time of day (HH:MM, school time zone)",
+    recurrence="How often to send it",
+    date="First date (YYYY-MM-DD); defaults to the next matching day",
+    channel="Channel to send it to",
+    **BROADCAST_DESCRIBE,
 )
-@app_commands.describe(channel="Channel to send the container to")
-async def send_sample_container(interaction: discord.Interaction, channel: discord.TextChannel):
+@app_commands.autocomplete(template=container_template_names)
+@app_commands.choices(recurrence=SCHEDULE_RECURRENCES)
+async def schedule_add(
+    interaction: discord.Interaction,
+    template: str,
+    time: str,
+    recurrence: app_commands.Choice[str],
+    date: str = None,
+    channel: discord.TextChannel = None,
+    channels: str = None,
+    category: discord.CategoryChannel = None,
+):
     if not await require_role(interaction, ROLE_DOCUMENT_MANAGER):
         return
+    if template not in container_templates:
+        await interaction.response.send_message(f"❌ No container template named '{template}'.", ephemeral=True)
+        return
+    targets, skipped = await resolve_channels(interaction.guild, channel, channels, category)
+    if not targets:
+        await interaction.response.send_message(
+            "❌ Pick a channel, a list of channels or a category." + describe_skipped(skipped), ephemeral=True
+        )
+        return
 
-    await interaction.response.defer(ephemeral=True)
+    try:
+        schedule_id, record = scheduler.add(
+            template, [c.id for c in targets], time, recurrence.value, date, author=interaction.user
+        )
+    except ValueError as e:
+        await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+        return
 
-    # Discohook-style payload
-    sessions = {
-  "flags": 32768,
-  "components": [
-      {
-      "type": 10,
-      "content": "@everyone"
-    },
-    {
-      "type": 17,
-      "components": [
-        {
-          "type": 12,
-          "items": [
-            {
-              "media": {
-                "url": "https://media.discordapp.net/attachments/1411299414869282847/1411759919241363527/Banners_11.png?ex=68b5d361&is=68b481e1&hm=95ceabba5571b5baf6bad6f9efe6c89ace8c0f66e659b9c5f4e043b9861c64fd&=&format=webp&quality=lossless"
-              }
-            }
-          ]
-        },
-        {
-          "type": 9,
-          "components": [
-            {
-              "type": 10,
-              "content": "# Gates opened,\nWe have now opened our gates to allow students to begin making their way to the hall. Please line up with your form group and await for the Headteacher to begin morning announcements.\n\nPlease ensure you are wearing your uniform, or it will be automatically applied to you when you join. Sixth Form students and visitors must visit reception to request their lanyard."
-            }
-          ],
-          "accessory": {
-            "type": 2,
-            "style": 5,
-            "label": "Join!",
-            "url": "https://www.roblox.com/games/83329354034194/Thornvale",
-
-          }
-        }
-      ]
-    }
-  ]
-}
+    await interaction.response.send_message(
+        f"✅ Scheduled: {describe_schedule(schedule_id, record)}" + describe_skipped(skipped), ephemeral=True
+    )
+    log_action(f"{interaction.user} scheduled '{template}' (`{schedule_id}`) {recurrence.value} at {record['time']}")
+
+
+@bot.tree.command(name="schedule_list", description="List scheduled container sends", guild=discord.Object(id=GUILD_ID))
+async def schedule_list(interaction: discord.Interaction):
+    if not await require_role(interaction, ROLE_DOCUMENT_MANAGER):
+        return
+    jobs = scheduler.jobs()
+    if not jobs:
+        await interaction.response.send_message("Nothing is scheduled.", ephemeral=True)
+        return
+    lines = [describe_schedule(sid, record) for sid, record in jobs]
+    await interaction.response.send_message("\n".join(lines)[:2000], ephemeral=True)
+
+
+@bot.tree.command(name="schedule_cancel", description="Cancel a scheduled container send", guild=discord.Object(id=GUILD_ID))
+@app_commands.autocomplete(schedule_id=schedule_ids)
+async def schedule_cancel(interaction: discord.Interaction, schedule_id: str):
+    if not await require_role(interaction, ROLE_DOCUMENT_MANAGER):
+        return
+    if not scheduler.cancel(schedule_id):
+        await interaction.response.send_message(f"❌ No schedule `{schedule_id}`.", ephemeral=True)
+        return
+    await interaction.response.send_message(f"🗑️ Schedule `{schedule_id}` cancelled.", ephemeral=True)
+    log_action(f"{interaction.user} cancelled schedule `{schedule_id}`")
+
+
+@bot.tree.command(name="schedule_preview", description="Preview the upcoming scheduled sends", guild=discord.Object(id=GUILD_ID))
+@app_commands.describe(schedule_id="Only this schedule", count="How many upcoming sends to show")
+@app_commands.autocomplete(schedule_id=schedule_ids)
+async def schedule_preview(
+    interaction: discord.Interaction, schedule_id: str = None, count: app_commands.Range[int, 1, 25] = 10
+):
+    if not await require_role(interaction, ROLE_DOCUMENT_MANAGER):
+        return
+    runs = scheduler.upcoming(count, schedule_id)
+    if not runs:
+        await interaction.response.send_message("Nothing is queued in the next two weeks.", ephemeral=True)
+        return
+    lines = [
+        f"<t:{int(run)}:F> (<t:{int(run)}:R>) · **{record['template']}** → "
+        + ", ".join(f"<#{c}>" for c in record["channel_ids"][:3])
+        + (" …" if len(record["channel_ids"]) > 3 else "")
+        + f" · `{sid}`"
+        for run, sid, record in runs
+    ]
+    await interaction.response.send_message("\n".join(lines)[:2000], ephemeral=True)
+
+
+# Registered last so stored templates can't shadow a built-in command
+for _name in container_templates.names():
+    if not register_container_command(_name):
+        print(f"[WARN] Container template '{_name}' clashes with a built-in command and has no command")
 
-  
-
-    url = f"https://discord.com/api/v10/channels/{channel.id}/messages"
-    headers = {
-        "Authorization": f"Bot {os.environ['DISCORD_TOKEN']}",
-        "Content-Type": "application/json"
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=sessions) as resp:
-            text = await resp.text()
-            if resp.status in (200, 201):
-                await interaction.followup.send(f"✅ Container sent to {channel.mention}")
-            else:
-                await interaction.followup.send(f"❌ Failed to send container: {resp.status} {text}")
-                
 # ---------------------------
-# Run FastAPI
+# Metrics gauges (read when Prometheus scrapes)
 # ---------------------------
-app = FastAPI()
-app.mount("/generated", StaticFiles(directory="generated"), name="generated")
+metrics.GATEWAY_LATENCY.set_function(lambda: bot.latency)
+metrics.WAIT_FOR_LISTENERS.set_function(lambda: sum(len(l) for l in bot._listeners.values()))
+metrics.RENDER_QUEUE.set_function(lambda: render_service.pending)
+metrics.AUDIT_BACKLOG.set_function(lambda: audit_log.backlog)
 
-def run_api():
-    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8000)))
+startup.mark("commands")
 
 # ---------------------------
-# Run Bot + FastAPI
+# Run Bot (the API server starts from setup_hook and stops in close)
 # ---------------------------
-threading.Thread(target=run_api, daemon=True).start()
 bot.run(os.environ['DISCORD_TOKEN'])
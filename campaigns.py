@@ -0,0 +1,165 @@
+import os
+import time
+import asyncio
+import discord
+
+DM_CAMPAIGN_WORKERS = int(os.environ.get("DM_CAMPAIGN_WORKERS", 3))
+DM_CAMPAIGN_INTERVAL = float(os.environ.get("DM_CAMPAIGN_INTERVAL", 1.0))
+STATUS_EDIT_INTERVAL = 3
+
+
+# ---------------------------
+# Queued mass-DM campaigns
+# ---------------------------
+# A campaign is one filled-in DM template queued for every member of a role.
+# Its state lives in a database collection (member list + sent/failed/closed ids), so
+# a restart resumes with whoever hasn't been handled yet. A small worker set
+# delivers the DMs, paced globally to stay clear of Discord's DM limits, and a
+# status message in the organiser's DMs is edited with live counts. stop()
+# lets in-flight DMs be recorded before shutdown closes the database.
+class DMCampaigns:
+    def __init__(self, bot, store, workers=DM_CAMPAIGN_WORKERS, interval=DM_CAMPAIGN_INTERVAL):
+        self.bot = bot
+        self.store = store
+        self.workers = max(1, workers)
+        self.interval = interval
+        self.tasks = {}
+        self._stopping = False
+        self._pace_lock = asyncio.Lock()
+        self._next_send = 0.0
+
+    def create(self, template_name, content, role, author, status_message=None):
+        campaign_id = f"{role.id}_{int(time.time())}"
+        self.store.set(campaign_id, {
+            "template": template_name,
+            "content": content,
+            "role_id": role.id,
+            "role_name": role.name,
+            "author": str(author),
+            "members": [m.id for m in role.members if not m.bot],
+            "sent": [],
+            "failed": [],
+            "closed": [],
+            "status_channel_id": status_message.channel.id if status_message else None,
+            "status_message_id": status_message.id if status_message else None,
+            "created": time.time(),
+            "done": False,
+        })
+        return campaign_id
+
+    def counts(self, campaign_id):
+        record = self.store.get(campaign_id)
+        if record is None:
+            return None
+        return {
+            "total": len(record["members"]),
+            "sent": len(record["sent"]),
+            "failed": len(record["failed"]),
+            "closed": len(record["closed"]),
+        }
+
+    def status_text(self, campaign_id):
+        record = self.store.get(campaign_id)
+        c = self.counts(campaign_id)
+        handled = c["sent"] + c["failed"] + c["closed"]
+        state = "✅ Finished" if record["done"] else "📨 Sending"
+        return (
+            f"{state} DM campaign `{campaign_id}` ('{record['template']}' → @{record['role_name']}): "
+            f"{handled}/{c['total']} handled — ✅ {c['sent']} sent, 🔒 {c['closed']} DMs closed, ❌ {c['failed']} failed"
+        )
+
+    def start(self, campaign_id):
+        task = self.tasks.get(campaign_id)
+        if task is None or task.done():
+            task = self.tasks[campaign_id] = asyncio.create_task(self._run(campaign_id))
+        return task
+
+    async def stop(self, timeout=10):
+        # Workers stop taking members and in-flight DMs get `timeout` to finish
+        # and be recorded; the rest is cancelled and resumes on next start
+        self._stopping = True
+        tasks = [task for task in self.tasks.values() if not task.done()]
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def resume_all(self):
+        resumed = [cid for cid, record in self.store.all().items() if not record["done"]]
+        for campaign_id in resumed:
+            self.start(campaign_id)
+        return resumed
+
+    # ---- delivery ----
+    async def _pace(self):
+        async with self._pace_lock:
+            loop = asyncio.get_running_loop()
+            wait = self._next_send - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_send = loop.time() + self.interval
+
+    async def _deliver(self, user_id, content):
+        try:
+            user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+            await user.send(content)
+            return "sent"
+        except discord.Forbidden:
+            return "closed"
+        except Exception:
+            # Errors from the client closing aren't this member's fault; leave
+            # them unhandled so the resumed campaign sends to them
+            if self._stopping or self.bot.is_closed():
+                raise
+            return "failed"
+
+    def _record(self, campaign_id, user_id, status):
+        self.store.update(campaign_id, lambda record: record[status].append(user_id))
+
+    async def _update_status(self, campaign_id):
+        record = self.store.get(campaign_id)
+        if not record.get("status_message_id"):
+            return
+        try:
+            channel = self.bot.get_partial_messageable(record["status_channel_id"])
+            await channel.get_partial_message(record["status_message_id"]).edit(content=self.status_text(campaign_id))
+        except discord.HTTPException:
+            pass
+
+    async def _run(self, campaign_id):
+        record = self.store.get(campaign_id)
+        handled = set(record["sent"]) | set(record["failed"]) | set(record["closed"])
+        queue = asyncio.Queue()
+        for user_id in record["members"]:
+            if user_id not in handled:
+                queue.put_nowait(user_id)
+
+        async def worker():
+            while not self._stopping:
+                try:
+                    user_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self._pace()
+                if self._stopping:
+                    return
+                self._record(campaign_id, user_id, await self._deliver(user_id, record["content"]))
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(STATUS_EDIT_INTERVAL)
+                await self._update_status(campaign_id)
+
+        status_task = asyncio.create_task(reporter())
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.workers)))
+        finally:
+            status_task.cancel()
+        if self._stopping:
+            return None  # not finished; resumes on next start
+
+        self.store.update(campaign_id, lambda record: record.update(done=True))
+        await self._update_status(campaign_id)
+        return self.counts(campaign_id)
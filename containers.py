@@ -0,0 +1,110 @@
+import re
+import json
+from discord_rest import scan_message_payload
+
+COMMAND_NAME = re.compile(r"^[a-z0-9_-]{1,32}$")
+JOIN_URL = "https://www.roblox.com/games/83329354034194/Thornvale"
+BANNER_URL = (
+    "https://media.discordapp.net/attachments/1411299414869282847/1411759919241363527/Banners_11.png"
+    "?ex=68b5d361&is=68b481e1&hm=95ceabba5571b5baf6bad6f9efe6c89ace8c0f66e659b9c5f4e043b9861c64fd&=&format=webp&quality=lossless"
+)
+
+
+def _announcement(text):
+    # @everyone + banner + text with a "Join!" link button (Discohook-style)
+    return {
+        "flags": 32768,
+        "components": [
+            {"type": 10, "content": "@everyone"},
+            {
+                "type": 17,
+                "components": [
+                    {"type": 12, "items": [{"media": {"url": BANNER_URL}}]},
+                    {
+                        "type": 9,
+                        "components": [{"type": 10, "content": text}],
+                        "accessory": {"type": 2, "style": 5, "label": "Join!", "url": JOIN_URL},
+                    },
+                ],
+            },
+        ],
+    }
+
+
+STAFF_JOIN_TEXT = (
+    "# Staff Join\nGreeting team, it is now time for you to begin joining our campus in preparation for the "
+    "session to begin. A reminder to equip your lanyard, radio and hivis jacket if required. If you have claimed a "
+    "classroom, please setup that classroom as you desire. \n\nFailure to attend when you have claimed a classroom "
+    "or duties will result in an immediate strike from the Human Resources Department."
+)
+SESSION_TEXT = (
+    "# Gates opened,\nWe have now opened our gates to allow students to begin making their way to the hall. Please "
+    "line up with your form group and await for the Headteacher to begin morning announcements.\n\nPlease ensure "
+    "you are wearing your uniform, or it will be automatically applied to you when you join. Sixth Form students "
+    "and visitors must visit reception to request their lanyard."
+)
+
+# Seeded into the registry on first start; after that they're ordinary
+# templates that can be replaced or removed with /container_template.
+DEFAULT_CONTAINERS = {
+    "staffjoin": {"description": "Trigger staff join.", "payload": _announcement(STAFF_JOIN_TEXT)},
+    "briefing": {"description": "Trigger staff weekly briefing.", "payload": _announcement(STAFF_JOIN_TEXT)},
+    "session": {"description": "Trigger session announcement.", "payload": _announcement(SESSION_TEXT)},
+}
+
+
+# ---------------------------
+# Container template registry
+# ---------------------------
+# Components V2 payloads stored in the embed_templates collection as
+# {"description": ..., "payload": {...}}. Each payload is validated once when
+# it is loaded or saved and kept as its serialized JSON bytes, so sending one
+# is a single byte-buffer POST per channel (DiscordREST.broadcast).
+class ContainerTemplates:
+    def __init__(self, store):
+        self.store = store
+        self._bodies = {}
+        for name, record in store.all().items():
+            if not isinstance(record, dict) or "payload" not in record:
+                continue
+            try:
+                self._bodies[name] = self._compile(record["payload"])
+            except ValueError as e:
+                print(f"[WARN] Container template '{name}' is invalid and was skipped: {e}")
+
+    @staticmethod
+    def _compile(payload):
+        if scan_message_payload(payload):
+            raise ValueError("container templates can't reference attachment:// files")
+        return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+    def names(self):
+        return sorted(self._bodies)
+
+    def __contains__(self, name):
+        return name in self._bodies
+
+    def body(self, name):
+        return self._bodies.get(name)
+
+    def description(self, name):
+        record = self.store.get(name) or {}
+        return (record.get("description") or f"Send the {name} container.")[:100]
+
+    def set(self, name, payload, description=None):
+        if not COMMAND_NAME.match(name):
+            raise ValueError("names must be 1-32 lowercase letters, digits, - or _")
+        body = self._compile(payload)
+        self.store.set(name, {"description": description, "payload": payload})
+        self._bodies[name] = body
+
+    def delete(self, name):
+        if self._bodies.pop(name, None) is None:
+            return False
+        self.store.delete(name)
+        return True
+
+    def seed(self, defaults):
+        for name, record in defaults.items():
+            if name not in self.store:
+                self.set(name, record["payload"], record.get("description"))
@@ -0,0 +1,244 @@
+import os
+import re
+import time
+import json
+import random
+import asyncio
+import tempfile
+import aiohttp
+from metrics import REST_REQUESTS, REST_SECONDS
+from tracing import span
+
+API_BASE = "https://discord.com/api/v10"
+JSON_HEADERS = {"Content-Type": "application/json"}
+SPOOL_BYTES = int(os.environ.get("RELAY_SPOOL_MB", 8)) * 1024 * 1024
+STREAM_CHUNK = 256 * 1024
+FLAG_COMPONENTS_V2 = 1 << 15
+ATTACHMENT_REF = re.compile(r"attachment://([\w\-. ()]+)")
+
+
+class RESTResponse:
+    def __init__(self, status, text, headers):
+        self.status = status
+        self.text = text
+        self.headers = headers
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+    def json(self):
+        return json.loads(self.text) if self.text else None
+
+
+# ---------------------------
+# Message payload checks
+# ---------------------------
+# One walk over a raw message payload (e.g. a Discohook export): checks the
+# shape Discord will accept and collects every attachment:// reference.
+def scan_message_payload(payload):
+    if not isinstance(payload, dict):
+        raise ValueError("payload must be a JSON object")
+    if not any(payload.get(k) for k in ("content", "embeds", "components", "sticker_ids", "poll")):
+        raise ValueError("payload has no content, embeds or components")
+    flags = payload.get("flags", 0)
+    if not isinstance(flags, int):
+        raise ValueError("flags must be an integer")
+    if flags & FLAG_COMPONENTS_V2 and (payload.get("content") or payload.get("embeds")):
+        raise ValueError("Components V2 messages (flags 32768) can't have content or embeds")
+    if len(payload.get("content") or "") > 2000:
+        raise ValueError("content is longer than 2000 characters")
+    for key in ("embeds", "components"):
+        if key in payload and not isinstance(payload[key], list):
+            raise ValueError(f"{key} must be a list")
+
+    refs = []
+    stack = [payload]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            stack.extend(reversed(list(value.values())))
+        elif isinstance(value, list):
+            stack.extend(reversed(value))
+        elif isinstance(value, str) and "attachment://" in value:
+            refs.extend(ATTACHMENT_REF.findall(value))
+    return list(dict.fromkeys(refs))
+
+
+async def _stream_file(fp):
+    # Streams a (possibly disk-backed) file into a request body chunk by chunk
+    fp.seek(0)
+    while True:
+        chunk = await asyncio.to_thread(fp.read, STREAM_CHUNK)
+        if not chunk:
+            return
+        yield chunk
+
+
+def build_multipart(payload, files):
+    # files: list of (filename, content_type, file object). Rebuildable, so it
+    # can be passed to DiscordREST.request as a retryable `data` factory.
+    def build():
+        form = aiohttp.FormData(quote_fields=False)
+        form.add_field("payload_json", json.dumps(payload), content_type="application/json")
+        for i, (filename, content_type, fp) in enumerate(files):
+            form.add_field(f"files[{i}]", _stream_file(fp), filename=filename, content_type=content_type)
+        return form
+    return build
+
+
+class _Bucket:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.remaining = None
+        self.reset_at = 0.0
+
+
+# ---------------------------
+# Shared Discord REST client
+# ---------------------------
+# One long-lived aiohttp session (keep-alive pooled connections) for the raw
+# v10 calls discord.py doesn't cover, e.g. Components V2 container posts.
+# Requests are tracked per rate-limit bucket (X-RateLimit-Bucket + the major
+# parameter, i.e. the channel), wait when a bucket is exhausted, and 429s are
+# retried after Retry-After with exponential backoff.
+class DiscordREST:
+    def __init__(self, token, max_retries=5, pool_size=100):
+        self.token = token
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self.session = None
+        self.cdn = None
+        self._route_buckets = {}
+        self._buckets = {}
+        self._global_reset_at = 0.0
+
+    async def start(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"Authorization": f"Bot {self.token}"},
+                timeout=aiohttp.ClientTimeout(total=60),
+            )
+            # Unauthenticated session on the same connection pool for CDN downloads
+            self.cdn = aiohttp.ClientSession(
+                connector=connector,
+                connector_owner=False,
+                timeout=aiohttp.ClientTimeout(total=None, sock_read=60),
+            )
+
+    async def close(self):
+        if self.cdn is not None:
+            await self.cdn.close()
+            self.cdn = None
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _bucket(self, route, major):
+        key = f"{self._route_buckets.get(route, route)}:{major}"
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket()
+        return bucket
+
+    def _update_bucket(self, route, bucket, headers):
+        if "X-RateLimit-Bucket" in headers:
+            self._route_buckets[route] = headers["X-RateLimit-Bucket"]
+        if "X-RateLimit-Remaining" in headers:
+            bucket.remaining = int(headers["X-RateLimit-Remaining"])
+        if "X-RateLimit-Reset-After" in headers:
+            bucket.reset_at = time.monotonic() + float(headers["X-RateLimit-Reset-After"])
+
+    async def request(self, method, route, major="", json=None, data=None, headers=None, **params):
+        # `route` is the path template, e.g. "/channels/{channel_id}/messages".
+        # `data` may be a zero-argument callable so multipart bodies can be
+        # rebuilt for a retry.
+        with span(f"rest {method} {route}"):
+            return await self._request(method, route, major, json, data, headers, params)
+
+    async def _request(self, method, route, major, json, data, headers, params):
+        await self.start()
+        route_key = f"{method} {route}"
+        url = API_BASE + route.format(**params)
+
+        for attempt in range(self.max_retries + 1):
+            delay = self._global_reset_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            bucket = self._bucket(route_key, major)
+            async with bucket.lock:
+                delay = bucket.reset_at - time.monotonic()
+                if bucket.remaining == 0 and delay > 0:
+                    await asyncio.sleep(delay)
+
+                body = data() if callable(data) else data
+                started = time.perf_counter()
+                async with self.session.request(method, url, json=json, data=body, headers=headers) as resp:
+                    text = await resp.text()
+                    self._update_bucket(route_key, bucket, resp.headers)
+                    response = RESTResponse(resp.status, text, resp.headers)
+                REST_SECONDS.labels(method, route).observe(time.perf_counter() - started)
+                REST_REQUESTS.labels(method, route, str(response.status)).inc()
+
+                if response.status == 429:
+                    try:
+                        retry_after = float(response.json().get("retry_after", 1))
+                    except (ValueError, AttributeError):
+                        retry_after = float(response.headers.get("Retry-After", 1))
+                    if response.headers.get("X-RateLimit-Global") == "true":
+                        self._global_reset_at = time.monotonic() + retry_after
+                    else:
+                        bucket.remaining = 0
+                        bucket.reset_at = time.monotonic() + retry_after
+                elif response.status in (502, 503, 504):
+                    retry_after = 0
+                else:
+                    return response
+
+            if attempt == self.max_retries:
+                break
+            # Exponential backoff (with jitter) on top of what Discord asked for
+            await asyncio.sleep(retry_after + min(30, 0.5 * 2 ** attempt) * random.random())
+        return response
+
+    async def download(self, url, spool_bytes=SPOOL_BYTES):
+        # Streams a CDN file into a spooled temp file: kept in memory up to
+        # spool_bytes, rolled over to disk beyond that.
+        await self.start()
+        fp = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        try:
+            with span("download"):
+                async with self.cdn.get(url) as resp:
+                    resp.raise_for_status()
+                    async for chunk in resp.content.iter_chunked(64 * 1024):
+                        fp.write(chunk)
+        except:
+            fp.close()
+            raise
+        fp.seek(0)
+        return fp
+
+    async def send_message(self, channel_id, payload=None, data=None, headers=None):
+        return await self.request(
+            "POST", "/channels/{channel_id}/messages", major=channel_id,
+            json=payload, data=data, headers=headers, channel_id=channel_id,
+        )
+
+    async def broadcast(self, channel_ids, payload, concurrency=10):
+        # The payload is serialized once and the same bytes are posted to every
+        # channel. Each channel is its own rate-limit bucket, so they run
+        # concurrently; `concurrency` keeps the fan-out under the global limit.
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        limit = asyncio.Semaphore(concurrency)
+
+        async def send(channel_id):
+            async with limit:
+                try:
+                    return await self.send_message(channel_id, data=body, headers=JSON_HEADERS)
+                except Exception as e:
+                    return e
+
+        return await asyncio.gather(*(send(channel_id) for channel_id in channel_ids))
@@ -0,0 +1,315 @@
+import io
+import os
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+from lxml import etree
+from docxtpl import DocxTemplate
+from docx import Document
+from docx.table import Table as DocxTable
+from docx.text.paragraph import Paragraph as DocxParagraph
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from jinja2 import Environment
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_JUSTIFY
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+from documents import W_NS
+
+TEMPLATE_CACHE_BYTES = int(os.environ.get("TEMPLATE_CACHE_MB", 64)) * 1024 * 1024
+
+# ---------------------------
+# Rendering engine (render workers only)
+# ---------------------------
+# Everything that needs docxtpl, python-docx, Jinja or reportlab lives here so
+# the bot process never imports them: RenderService workers import this module
+# on their first job (or at warm-up).
+
+
+# ---------------------------
+# Parsed-template cache (lives in each render worker)
+# ---------------------------
+# docxtpl re-reads the file, regex-patches every XML part and compiles it with
+# Jinja on each render. For an unchanged template the patched XML and the
+# compiled Jinja templates are always the same, so they are kept per template
+# and reused; renders then only pay for substitution and serialization.
+class _CompiledEnvironment(Environment):
+    def __init__(self, entry):
+        super().__init__()
+        self._entry = entry
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals is not None or template_class is not None:
+            return super().from_string(source, globals, template_class)
+        template = self._entry.compiled.get(source)
+        if template is None:
+            template = super().from_string(source)
+            self._entry.compiled[source] = template
+        return template
+
+
+class _CachedDocxTemplate(DocxTemplate):
+    def __init__(self, entry):
+        super().__init__(io.BytesIO(entry.data))
+        self._entry = entry
+
+    def patch_xml(self, src_xml):
+        patched = self._entry.patched.get(src_xml)
+        if patched is None:
+            patched = super().patch_xml(src_xml)
+            self._entry.patched[src_xml] = patched
+        return patched
+
+
+class _TemplateEntry:
+    def __init__(self, stamp, data):
+        self.stamp = stamp
+        self.data = data
+        self.patched = {}
+        self.compiled = {}
+        self.env = _CompiledEnvironment(self)
+
+    @property
+    def size(self):
+        # Compiled Jinja code is roughly the size of its source
+        patched = sum(len(k) + len(v) for k, v in self.patched.items())
+        compiled = sum(2 * len(k) for k in self.compiled)
+        return len(self.data) + patched + compiled
+
+
+class TemplateCache:
+    def __init__(self, max_bytes=TEMPLATE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        # Keyed by path + file identity, so a template replaced by
+        # /add_template or /update_anntemplate (saved as a new file, see
+        # save_upload in bot.py) is picked up on its next render. The cache
+        # lives in the render workers, so this stamp is the only invalidation.
+        st = os.stat(path)
+        stamp = (st.st_ino, st.st_ctime_ns, st.st_mtime_ns, st.st_size)
+        entry = self._entries.get(path)
+        if entry is not None and entry.stamp == stamp:
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        with open(path, "rb") as f:
+            entry = _TemplateEntry(stamp, f.read())
+        self._entries[path] = entry
+        return entry
+
+    @property
+    def size(self):
+        return sum(entry.size for entry in self._entries.values())
+
+    def evict(self):
+        total = self.size
+        while total > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            total -= entry.size
+
+
+_template_cache = TemplateCache()
+
+
+# ---------------------------
+# PDF output (reportlab)
+# ---------------------------
+# A flow-layout rendition of the rendered DOCX: headings, paragraphs with
+# bold/italic/underline runs, alignment, tables, images (inline and floating,
+# placed in the text flow), text boxes, and the first section's header and
+# footer repeated on every page. It is meant for quick viewing straight from
+# /generated, not as a copy of Word's layout. Still dropped: vector images
+# (EMF/WMF), shapes and charts, footnotes, page numbers/fields, columns and
+# exact positioning.
+_PDF_STYLES = getSampleStyleSheet()
+_PDF_ALIGN = {
+    WD_ALIGN_PARAGRAPH.CENTER: TA_CENTER,
+    WD_ALIGN_PARAGRAPH.RIGHT: TA_RIGHT,
+    WD_ALIGN_PARAGRAPH.JUSTIFY: TA_JUSTIFY,
+}
+
+
+def _pdf_style(paragraph):
+    name = paragraph.style.name if paragraph.style is not None else ""
+    if name == "Title":
+        base = _PDF_STYLES["Title"]
+    elif name.startswith("Heading"):
+        level = name.rsplit(" ", 1)[-1]
+        base = _PDF_STYLES.get(f"Heading{level}" if level in ("1", "2", "3") else "Heading4")
+    else:
+        base = _PDF_STYLES["Normal"]
+    alignment = _PDF_ALIGN.get(paragraph.alignment)
+    if alignment is None:
+        return base
+    return ParagraphStyle(f"{base.name}-{alignment}", parent=base, alignment=alignment)
+
+
+def _pdf_markup(paragraph):
+    parts = []
+    for run in paragraph.runs:
+        text = escape(run.text).replace("\n", "<br/>").replace("\t", "&nbsp;&nbsp;&nbsp;&nbsp;")
+        if not text:
+            continue
+        if run.bold:
+            text = f"<b>{text}</b>"
+        if run.italic:
+            text = f"<i>{text}</i>"
+        if run.underline:
+            text = f"<u>{text}</u>"
+        parts.append(text)
+    return "".join(parts)
+
+
+_PDF_NS = {
+    "w": W_NS[1:-1],
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "wp": "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing",
+    "mc": "http://schemas.openxmlformats.org/markup-compatibility/2006",
+}
+# mc:Fallback holds a legacy (VML) copy of the same drawing or text box
+_DRAWINGS = etree.XPath(".//w:drawing[not(ancestor::mc:Fallback)]", namespaces=_PDF_NS)
+_BLIP = etree.XPath(".//a:blip/@r:embed", namespaces=_PDF_NS)
+_EXTENT = etree.XPath("./wp:inline/wp:extent | ./wp:anchor/wp:extent", namespaces=_PDF_NS)
+_TEXT_BOXES = etree.XPath(".//w:txbxContent[not(ancestor::mc:Fallback)]", namespaces=_PDF_NS)
+_EMU_PER_INCH = 914400
+
+
+def _own(elements, p):
+    # Drops matches that belong to a text box nested inside paragraph p;
+    # those are handled when the text box's own paragraphs are converted
+    owned = []
+    for element in elements:
+        parent = element.getparent()
+        while parent is not None and parent is not p and parent.tag != W_NS + "txbxContent":
+            parent = parent.getparent()
+        if parent is p:
+            owned.append(element)
+    return owned
+
+
+def _pdf_images(paragraph, max_width):
+    images = []
+    for drawing in _own(_DRAWINGS(paragraph._p), paragraph._p):
+        rids = _BLIP(drawing)
+        part = paragraph.part.related_parts.get(rids[0]) if rids else None
+        if part is None:
+            continue
+        extent = _EXTENT(drawing)
+        try:
+            if extent:
+                width = int(extent[0].get("cx")) / _EMU_PER_INCH * inch
+                height = int(extent[0].get("cy")) / _EMU_PER_INCH * inch
+                if width > max_width:
+                    width, height = max_width, height * max_width / width
+                image = Image(io.BytesIO(part.blob), width=width, height=height)
+            else:
+                image = Image(io.BytesIO(part.blob))
+                image._restrictSize(max_width, max_width)
+            image.hAlign = {TA_CENTER: "CENTER", TA_RIGHT: "RIGHT"}.get(_pdf_style(paragraph).alignment, "LEFT")
+            images.append(image)
+        except Exception:
+            continue  # formats reportlab can't draw (EMF/WMF)
+    return images
+
+
+def _pdf_paragraph(paragraph, max_width):
+    flowables = []
+    markup = _pdf_markup(paragraph)
+    if markup.strip():
+        flowables.append(Paragraph(markup, _pdf_style(paragraph)))
+    flowables.extend(_pdf_images(paragraph, max_width))
+    for box in _own(_TEXT_BOXES(paragraph._p), paragraph._p):
+        for p in box.iterchildren(W_NS + "p"):
+            flowables.extend(_pdf_paragraph(DocxParagraph(p, paragraph._parent), max_width))
+    return flowables or [Spacer(1, 8)]
+
+
+def _pdf_flowables(element, parent, max_width):
+    # element: the document body or a header/footer; parent: what owns its part
+    flowables = []
+    for child in element.iterchildren():
+        if child.tag == W_NS + "p":
+            flowables.extend(_pdf_paragraph(DocxParagraph(child, parent), max_width))
+        elif child.tag == W_NS + "tbl":
+            table = DocxTable(child, parent)
+            cell_width = max_width / max(1, len(table.columns))
+            data = [
+                [[f for p in cell.paragraphs for f in _pdf_paragraph(p, cell_width - 12)] for cell in row.cells]
+                for row in table.rows
+            ]
+            if data:
+                pdf_table = Table(data, hAlign="LEFT")
+                pdf_table.setStyle(TableStyle([
+                    ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+                    ("VALIGN", (0, 0), (-1, -1), "TOP"),
+                ]))
+                flowables.append(pdf_table)
+    return flowables
+
+
+def _pdf_margin_block(part, max_width):
+    # Header/footer flowables with their total height, or ([], 0) when the
+    # section has none of its own
+    if part.is_linked_to_previous:
+        return [], 0
+    flowables = [f for f in _pdf_flowables(part._element, part, max_width) if not isinstance(f, Spacer)]
+    return flowables, sum(f.wrap(max_width, A4[1])[1] for f in flowables)
+
+
+def docx_to_pdf(docx_path, pdf_path):
+    # Reuse the cached PDF while it is newer than the DOCX it was made from
+    if os.path.exists(pdf_path) and os.path.getmtime(pdf_path) >= os.path.getmtime(docx_path):
+        return pdf_path
+
+    doc = Document(docx_path)
+    tmp_path = f"{pdf_path}.{os.getpid()}.part"
+    margin = inch
+    width = A4[0] - 2 * margin
+    section = doc.sections[0]
+    header, header_height = _pdf_margin_block(section.header, width)
+    footer, footer_height = _pdf_margin_block(section.footer, width)
+
+    def draw_margins(canvas, _):
+        y = A4[1] - margin / 2
+        for f in header:
+            y -= f.wrap(width, A4[1])[1]
+            f.drawOn(canvas, margin, y)
+        y = margin / 2 + footer_height
+        for f in footer:
+            y -= f.wrap(width, A4[1])[1]
+            f.drawOn(canvas, margin, y)
+
+    pdf = SimpleDocTemplate(
+        tmp_path, pagesize=A4, title=os.path.basename(pdf_path), leftMargin=margin, rightMargin=margin,
+        topMargin=max(margin, margin / 2 + header_height + 12), bottomMargin=max(margin, margin / 2 + footer_height + 12),
+    )
+    pdf.build(_pdf_flowables(doc.element.body, doc, width) or [Spacer(1, 1)], onFirstPage=draw_margins, onLaterPages=draw_margins)
+    os.replace(tmp_path, pdf_path)
+    return pdf_path
+
+
+# ---------------------------
+# Worker side (runs in the process pool)
+# ---------------------------
+def render_docx(template_path, context, output_path, pdf_path=None):
+    entry = _template_cache.get(template_path)
+    doc = _CachedDocxTemplate(entry)
+    doc.render(context, jinja_env=entry.env)
+    # Write under a temporary name so a concurrent identical render or a
+    # download never sees a half-written file
+    tmp_path = f"{output_path}.{os.getpid()}.part"
+    doc.save(tmp_path)
+    os.replace(tmp_path, output_path)
+    # Entries grow as parts get compiled, so enforce the budget after rendering
+    _template_cache.evict()
+    if pdf_path:
+        docx_to_pdf(output_path, pdf_path)
+    return output_path
@@ -0,0 +1,254 @@
+import io
+import os
+import re
+import csv
+import json
+import time
+import asyncio
+import zipfile
+import fnmatch
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from xml.etree.ElementTree import XMLPullParser
+from metrics import RENDERS, RENDER_SECONDS, RENDER_BYTES
+from tracing import span
+
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+RENDER_QUEUE_LIMIT = int(os.environ.get("RENDER_QUEUE_LIMIT", 32))
+RENDER_TIMEOUT = float(os.environ.get("RENDER_TIMEOUT", 60))
+RENDER_WARMUP = os.environ.get("RENDER_WARMUP", "0") == "1"
+BULK_MAX_ROWS = int(os.environ.get("BULK_MAX_ROWS", 1000))
+
+
+class RenderQueueFull(Exception):
+    pass
+
+
+# ---------------------------
+# Field extraction
+# ---------------------------
+# Streams the WordprocessingML parts straight out of the .docx zip instead of
+# building a python-docx Document. Text is collected per <w:p>, so placeholders
+# Word split across several runs are joined back together, and tables, text
+# boxes, headers and footers are covered like the body. Elements are dropped as
+# soon as they close, so memory stays flat regardless of document size.
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+FIELD_PARTS = ("word/document.xml", "word/header*.xml", "word/footer*.xml", "word/footnotes.xml")
+FIELD_RE = re.compile(r"\{\{(.*?)\}\}")
+CHUNK_SIZE = 64 * 1024
+
+
+def _part_paragraphs(stream):
+    parser = XMLPullParser(events=("start", "end"))
+    elements = []
+    paragraphs = []
+
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if event == "start":
+                elements.append(elem)
+                if elem.tag == W_NS + "p":
+                    paragraphs.append([])
+                continue
+
+            elements.pop()
+            if elem.tag == W_NS + "t" and paragraphs and elem.text:
+                paragraphs[-1].append(elem.text)
+            elif elem.tag == W_NS + "p" and paragraphs:
+                yield "".join(paragraphs.pop())
+            elem.clear()
+            if elements:
+                elements[-1].remove(elem)
+    parser.close()
+
+
+def extract_fields(file_path):
+    fields = {}
+    with zipfile.ZipFile(file_path) as z:
+        for name in z.namelist():
+            if not any(fnmatch.fnmatch(name, pattern) for pattern in FIELD_PARTS):
+                continue
+            with z.open(name) as stream:
+                for text in _part_paragraphs(stream):
+                    if "{{" not in text:
+                        continue
+                    for field in FIELD_RE.findall(text):
+                        fields[field.strip()] = None
+    return list(fields)
+
+
+# ---------------------------
+# Worker entry points
+# ---------------------------
+# The heavy document libraries are imported inside the render workers, never
+# in the bot process (see docrender.py).
+def _render_job(template_path, context, output_path, pdf_path):
+    from docrender import render_docx
+    return render_docx(template_path, context, output_path, pdf_path)
+
+
+def _warm_job():
+    import docrender  # noqa: F401
+    return os.getpid()
+
+
+# ---------------------------
+# Render service (event loop side)
+# ---------------------------
+class RenderService:
+    def __init__(self, workers=RENDER_WORKERS, queue_limit=RENDER_QUEUE_LIMIT, timeout=RENDER_TIMEOUT):
+        self.workers = max(1, workers)
+        self.queue_limit = max(self.workers, queue_limit)
+        self.timeout = timeout
+        self.pending = 0
+        self._executor = None
+
+    def start(self):
+        if self._executor is None:
+            # Workers are forked so they never re-import bot.py. Processes are
+            # only created on the first job, and each loads docrender then.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("fork")
+            )
+
+    async def warm_up(self):
+        # Starts the workers and loads the document libraries in them ahead of
+        # the first real render; returns (workers warmed, seconds taken)
+        self.start()
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        pids = await asyncio.gather(*(loop.run_in_executor(self._executor, _warm_job) for _ in range(self.workers)))
+        return len(set(pids)), time.perf_counter() - started
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _discard(self, executor):
+        # A worker that dies (OOM kill, segfault) breaks the whole pool; drop
+        # it so the next job starts a fresh one
+        if self._executor is executor:
+            print("[WARN] A render worker died; restarting the render pool")
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _submit(self, func, *args):
+        if self.pending >= self.queue_limit:
+            raise RenderQueueFull(f"{self.pending} render jobs already queued")
+        self.start()
+        executor = self._executor
+        try:
+            future = executor.submit(func, *args)
+        except BrokenProcessPool:
+            self._discard(executor)
+            self.start()
+            executor = self._executor
+            future = executor.submit(func, *args)
+
+        # The slot is released when the worker actually finishes, not when the
+        # caller gives up, so timed-out jobs still count against the queue limit.
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+
+    def _release(self):
+        self.pending -= 1
+
+    async def render(self, template_path, context, output_path, pdf_path=None):
+        fmt = "pdf" if pdf_path else "docx"
+        started = time.perf_counter()
+        try:
+            with span(f"render {fmt}"):
+                result = await self._submit(_render_job, template_path, context, output_path, pdf_path)
+        except RenderQueueFull:
+            RENDERS.labels(fmt, "queue_full").inc()
+            raise
+        except asyncio.TimeoutError:
+            RENDERS.labels(fmt, "timeout").inc()
+            raise
+        except Exception:
+            RENDERS.labels(fmt, "error").inc()
+            raise
+        RENDERS.labels(fmt, "ok").inc()
+        RENDER_SECONDS.labels(fmt).observe(time.perf_counter() - started)
+        RENDER_BYTES.observe(os.path.getsize(output_path))
+        return result
+
+    async def render_many(self, template_path, contexts, output_paths, progress=None):
+        # Returns one entry per row: the output path, or the exception that row
+        # failed with. At most `workers` rows are in flight so a bulk job
+        # doesn't crowd single renders out of the queue.
+        results = [None] * len(contexts)
+        limit = asyncio.Semaphore(self.workers)
+        done = 0
+
+        async def run(i):
+            nonlocal done
+            async with limit:
+                deadline = time.monotonic() + self.timeout
+                while True:
+                    try:
+                        results[i] = await self.render(template_path, contexts[i], output_paths[i])
+                        break
+                    except RenderQueueFull as e:
+                        if time.monotonic() > deadline:
+                            results[i] = e
+                            break
+                        await asyncio.sleep(0.5)
+                    except Exception as e:
+                        results[i] = e
+                        break
+            done += 1
+            if progress:
+                await progress(done, len(contexts))
+
+        await asyncio.gather(*(run(i) for i in range(len(contexts))))
+        return results
+
+
+# ---------------------------
+# Bulk generation helpers
+# ---------------------------
+def parse_bulk_rows(filename, raw):
+    # CSV with a header row, or a JSON list of objects (optionally under "rows")
+    text = raw.decode("utf-8-sig")
+    if filename.lower().endswith(".json"):
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get("rows")
+        if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+            raise ValueError("JSON must be a list of objects, one per recipient")
+        rows = [{str(k): "" if v is None else str(v) for k, v in row.items()} for row in data]
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames:
+            raise ValueError("CSV is missing a header row")
+        rows = [{k.strip(): (v or "").strip() for k, v in row.items() if k} for row in reader]
+
+    if not rows:
+        raise ValueError("No rows found")
+    if len(rows) > BULK_MAX_ROWS:
+        raise ValueError(f"Too many rows ({len(rows)}); the limit is {BULK_MAX_ROWS}")
+    return rows
+
+
+def write_zip(zip_path, files):
+    # files: list of (path on disk, name inside the archive). DOCX files are
+    # already deflated, so they are stored as-is and streamed in one by one.
+    tmp_path = zip_path + ".part"
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED) as z:
+        for path, arcname in files:
+            z.write(path, arcname)
+    os.replace(tmp_path, zip_path)
+    return zip_path
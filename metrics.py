@@ -0,0 +1,84 @@
+import time
+from discord import app_commands, InteractionType
+from tracing import tracer
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# ---------------------------
+# Prometheus metrics
+# ---------------------------
+# Served by the FastAPI app at /metrics. Everything here is a counter/histogram
+# update on the hot path (a lock and an add) or a gauge read at scrape time, so
+# it stays on in production. Labels are command names and templated REST
+# routes only, which keeps the series count fixed.
+WIZARD_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+COMMANDS = Counter(
+    "hrmanager_commands_total", "Slash command invocations", ["command", "outcome"]
+)
+COMMAND_SECONDS = Histogram(
+    "hrmanager_command_duration_seconds",
+    "Slash command handler time, including DM wizard steps",
+    ["command"],
+    buckets=WIZARD_BUCKETS,
+)
+
+RENDERS = Counter("hrmanager_renders_total", "DOCX render jobs", ["format", "outcome"])
+RENDER_SECONDS = Histogram(
+    "hrmanager_render_duration_seconds",
+    "DOCX (and PDF) render time as seen by the bot, including queue wait",
+    ["format"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120),
+)
+RENDER_BYTES = Histogram(
+    "hrmanager_render_output_bytes",
+    "Size of rendered DOCX files",
+    buckets=(16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6),
+)
+RENDER_QUEUE = Gauge("hrmanager_render_queue_depth", "Render jobs queued or running")
+
+REST_REQUESTS = Counter(
+    "hrmanager_discord_rest_requests_total", "Outbound Discord REST responses", ["method", "route", "status"]
+)
+REST_SECONDS = Histogram(
+    "hrmanager_discord_rest_duration_seconds", "Outbound Discord REST request latency", ["method", "route"]
+)
+
+GATEWAY_LATENCY = Gauge("hrmanager_gateway_latency_seconds", "Discord gateway heartbeat latency")
+WAIT_FOR_LISTENERS = Gauge(
+    "hrmanager_wait_for_listeners", "Active bot.wait_for listeners (DM wizards waiting on a reply)"
+)
+AUDIT_BACKLOG = Gauge("hrmanager_audit_backlog", "Audit log entries waiting to be posted")
+
+
+def render_metrics():
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+# ---------------------------
+# Slash command instrumentation
+# ---------------------------
+# interaction_check runs before every command and stamps the start time (and
+# starts a trace/profile when tracing asks for one); the bot's
+# on_app_command_completion (success) or the tree's on_error (failure) record
+# the outcome. Autocomplete requests also pass through interaction_check but
+# never complete or fail, so they're left alone.
+class InstrumentedTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction):
+        if interaction.type is InteractionType.autocomplete:
+            return True
+        interaction.extras["started"] = time.perf_counter()
+        tracer.begin(interaction)
+        return True
+
+    async def on_error(self, interaction, error):
+        observe_command(interaction, interaction.command, "error")
+        await super().on_error(interaction, error)
+
+
+def observe_command(interaction, command, outcome):
+    name = command.qualified_name if command is not None else "unknown"
+    COMMANDS.labels(name, outcome).inc()
+    started = interaction.extras.get("started")
+    if started is not None:
+        COMMAND_SECONDS.labels(name).observe(time.perf_counter() - started)
+    tracer.finish(interaction, outcome)
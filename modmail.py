@@ -0,0 +1,123 @@
+import asyncio
+import discord
+from storage import load_tickets, save_ticket, delete_ticket
+
+MAX_FILES_PER_MESSAGE = 10
+
+
+# ---------------------------
+# Modmail ticket index
+# ---------------------------
+# user -> channel and channel -> user maps, loaded once and kept in sync by
+# open/close, so both directions of the modmail relay are dictionary lookups.
+# Resolved ticket users are cached alongside so a staff reply doesn't need a
+# fetch_user round-trip.
+#
+# Persistence is write-behind: open/close queue a single-row write on the
+# database thread and return immediately; SQLite's WAL makes it durable.
+class TicketIndex:
+    def __init__(self, db):
+        self.db = db
+        self.by_user = {}
+        self.by_channel = {}
+        self.users = {}
+        for user_id, channel_id in load_tickets(db).items():
+            self._link(user_id, channel_id)
+
+    def _link(self, user_id, channel_id):
+        self._unlink(user_id)
+        self.by_user[user_id] = channel_id
+        self.by_channel[channel_id] = user_id
+
+    def _unlink(self, user_id):
+        channel_id = self.by_user.pop(user_id, None)
+        if channel_id is not None:
+            self.by_channel.pop(channel_id, None)
+        return channel_id
+
+    # ---- lookups (memory only) ----
+    def __contains__(self, user_id):
+        return user_id in self.by_user
+
+    def channel_for(self, user_id):
+        return self.by_user.get(user_id)
+
+    def user_for(self, channel_id):
+        return self.by_channel.get(channel_id)
+
+    # ---- updates ----
+    def open(self, user, channel_id):
+        self._link(user.id, channel_id)
+        self.users[user.id] = user
+        save_ticket(self.db, user.id, channel_id)
+
+    def close(self, user_id):
+        channel_id = self._unlink(user_id)
+        if channel_id is None:
+            return None
+        self.users.pop(user_id, None)
+        delete_ticket(self.db, user_id)
+        return channel_id
+
+    async def resolve_user(self, bot, user_id):
+        user = self.users.get(user_id) or bot.get_user(user_id)
+        if user is None:
+            user = await bot.fetch_user(user_id)
+        self.users[user_id] = user
+        return user
+
+
+# ---------------------------
+# Attachment relay
+# ---------------------------
+# Downloads all attachments of a message concurrently through DiscordREST's
+# spooled download (small files stay in memory, large ones roll over to disk),
+# so a big upload is never held whole in RAM. Files are
+# then batched (Discord's 10 files / upload size limit per message) and the
+# first batch goes out in the same message as the embed. Anything too large
+# to re-upload, or that failed to download, is relayed as a link instead.
+async def _fetch_attachment(rest, attachment):
+    fp = await rest.download(attachment.url)
+    return discord.File(fp, filename=attachment.filename, spoiler=attachment.is_spoiler())
+
+
+def _batches(attachments, limit):
+    batches, current, size = [], [], 0
+    for attachment in attachments:
+        if current and (len(current) == MAX_FILES_PER_MESSAGE or size + attachment.size > limit):
+            batches.append(current)
+            current, size = [], 0
+        current.append(attachment)
+        size += attachment.size
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def relay_message(destination, attachments, rest, limit=discord.utils.DEFAULT_FILE_SIZE_LIMIT_BYTES,
+                        embed=None, label="📎 Attachments"):
+    sendable = [a for a in attachments if a.size <= limit]
+    links = [a for a in attachments if a.size > limit]
+
+    results = await asyncio.gather(*(_fetch_attachment(rest, a) for a in sendable), return_exceptions=True)
+    files = {}
+    for attachment, result in zip(sendable, results):
+        if isinstance(result, Exception):
+            links.append(attachment)
+        else:
+            files[attachment.id] = result
+    sendable = [a for a in sendable if a.id in files]
+
+    try:
+        batches = _batches(sendable, limit) or [[]]
+        for i, batch in enumerate(batches):
+            if i == 0:
+                await destination.send(embed=embed, files=[files[a.id] for a in batch])
+            else:
+                await destination.send(label, files=[files[a.id] for a in batch])
+    finally:
+        for f in files.values():
+            f.close()
+
+    if links:
+        await destination.send(f"{label} (too large to forward):\n" + "\n".join(a.url for a in links))
@@ -0,0 +1,204 @@
+import os
+import time
+import uuid
+import heapq
+import asyncio
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+SCHEDULE_TZ = os.environ.get("SCHEDULE_TZ", "Europe/London")
+SCHEDULE_CATCHUP_MINUTES = float(os.environ.get("SCHEDULE_CATCHUP_MINUTES", 30))
+MAX_SLEEP = 60  # re-check the wall clock at least this often
+
+RECURRENCES = {
+    "once": "Once",
+    "daily": "Every day",
+    "weekdays": "School days (Mon-Fri)",
+    "weekly": "Every week",
+}
+
+
+# ---------------------------
+# Announcement scheduler
+# ---------------------------
+# Scheduled sends (container template, channels, local time, recurrence) are
+# records in a database collection keyed by a short id. One task drives all of
+# them from a heap of (next_run, id): it sleeps until the earliest entry is due
+# (or the heap changes), fires everything due and pushes recurring jobs back
+# with their next run. Heap entries aren't removed on cancel/reschedule; an
+# entry whose time no longer matches the record is just skipped.
+#
+# On start every stored job is queued as-is, so runs missed while the bot was
+# down fire immediately if they're less than SCHEDULE_CATCHUP_MINUTES late and
+# are skipped (and logged) otherwise; recurring jobs then continue from now.
+class AnnouncementScheduler:
+    def __init__(self, store, send, log=print, tz=SCHEDULE_TZ, catchup_minutes=SCHEDULE_CATCHUP_MINUTES):
+        self.store = store
+        self.send = send
+        self.log = log
+        try:
+            self.tz = ZoneInfo(tz)
+        except (ZoneInfoNotFoundError, ValueError):
+            # Slim images may have no zoneinfo database (tzdata is in
+            # requirements.txt); don't let that stop the whole bot
+            print(f"[WARN] Time zone '{tz}' not found; scheduling in UTC")
+            self.tz = timezone.utc
+        self.catchup = catchup_minutes * 60
+        self._heap = []
+        self._wakeup = None
+        self._task = None
+        self._sends = set()  # the loop only keeps weak references to tasks
+
+    # ---- time helpers ----
+    def _matches(self, record, day):
+        recurrence = record["recurrence"]
+        if recurrence == "weekdays":
+            return day.weekday() < 5
+        if recurrence == "weekly":
+            return day.weekday() == record["weekday"]
+        return True
+
+    def _at(self, day, clock):
+        hour, minute = map(int, clock.split(":"))
+        return datetime(day.year, day.month, day.day, hour, minute, tzinfo=self.tz).timestamp()
+
+    def next_after(self, record, after):
+        # First run strictly after `after` (unix time), or None for one-offs
+        local = datetime.fromtimestamp(after, self.tz).date()
+        for offset in range(8):
+            day = local + timedelta(days=offset)
+            if self._matches(record, day):
+                run = self._at(day, record["time"])
+                if run > after:
+                    return run
+        return None
+
+    def parse_time(self, clock, date=None):
+        # Validates "HH:MM" (and optional "YYYY-MM-DD"); returns normalized values
+        try:
+            hour, minute = map(int, clock.strip().split(":"))
+            clock = f"{hour:02d}:{minute:02d}"
+            datetime(2000, 1, 1, hour, minute)
+            day = datetime.strptime(date.strip(), "%Y-%m-%d").date() if date else None
+        except ValueError:
+            raise ValueError("use HH:MM for the time and YYYY-MM-DD for the date")
+        return clock, day
+
+    # ---- jobs ----
+    def add(self, template, channel_ids, clock, recurrence="once", date=None, author=None):
+        if recurrence not in RECURRENCES:
+            raise ValueError(f"recurrence must be one of {', '.join(RECURRENCES)}")
+        clock, day = self.parse_time(clock, date)
+        now = time.time()
+        today = datetime.fromtimestamp(now, self.tz).date()
+        record = {
+            "template": template,
+            "channel_ids": list(channel_ids),
+            "time": clock,
+            "recurrence": recurrence,
+            "weekday": (day or today).weekday(),
+            "author": str(author),
+            "created": now,
+            "last_run": None,
+            "last_status": None,
+        }
+
+        if day is not None:
+            first = self._at(day, clock)
+            if first <= now:
+                if recurrence == "once":
+                    raise ValueError("that time is already in the past")
+                first = self.next_after(record, now)
+            elif not self._matches(record, day):
+                first = self.next_after(record, first)
+        else:
+            first = self.next_after(dict(record, recurrence="daily" if recurrence == "once" else recurrence), now)
+        record["next_run"] = first
+
+        schedule_id = uuid.uuid4().hex[:8]
+        self.store.set(schedule_id, record)
+        self._push(first, schedule_id)
+        return schedule_id, record
+
+    def cancel(self, schedule_id):
+        # The heap entry goes stale and is skipped when it comes up
+        return self.store.delete(schedule_id)
+
+    def jobs(self):
+        return sorted(self.store.all().items(), key=lambda item: item[1]["next_run"])
+
+    def upcoming(self, limit=10, schedule_id=None, horizon_days=14):
+        # The next `limit` sends across all jobs (or one), in time order
+        horizon = time.time() + horizon_days * 86400
+        runs = []
+        for sid, record in self.store.all().items():
+            if schedule_id and sid != schedule_id:
+                continue
+            run = record["next_run"]
+            while run is not None and run <= horizon and len(runs) < limit * 4:
+                runs.append((run, sid, record))
+                run = self.next_after(record, run) if record["recurrence"] != "once" else None
+        return sorted(runs, key=lambda r: r[0])[:limit]
+
+    # ---- timer ----
+    def _push(self, run, schedule_id):
+        heapq.heappush(self._heap, (run, schedule_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._heap = [(record["next_run"], sid) for sid, record in self.store.all().items()]
+        heapq.heapify(self._heap)
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                run, schedule_id = heapq.heappop(self._heap)
+                self._due(schedule_id, run, now)
+
+            self._wakeup.clear()
+            delay = min(self._heap[0][0] - now, MAX_SLEEP) if self._heap else MAX_SLEEP
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(delay, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    def _due(self, schedule_id, run, now):
+        record = self.store.get(schedule_id)
+        if record is None or record["next_run"] != run:
+            return  # cancelled or rescheduled since this entry was queued
+
+        late = now - run
+        status = "missed" if late > self.catchup else "sending"
+        next_run = self.next_after(record, now) if record["recurrence"] != "once" else None
+
+        # Persist the next run before sending so a crash mid-send can't repeat it
+        if next_run is None:
+            self.store.delete(schedule_id)
+        else:
+            self.store.update(schedule_id, lambda r: r.update(next_run=next_run, last_run=now, last_status=status))
+            self._push(next_run, schedule_id)
+
+        if status == "missed":
+            self.log(f"Scheduled '{record['template']}' (`{schedule_id}`) skipped: {int(late // 60)} minutes late")
+        else:
+            task = asyncio.create_task(self._send(schedule_id, record))
+            self._sends.add(task)
+            task.add_done_callback(self._sends.discard)
+
+    async def _send(self, schedule_id, record):
+        try:
+            status = await self.send(record["template"], record["channel_ids"])
+        except Exception as e:
+            status = f"failed: {e}"
+        if schedule_id in self.store:
+            self.store.update(schedule_id, lambda r: r.update(last_status=status))
+        self.log(f"Scheduled '{record['template']}' (`{schedule_id}`): {status}")
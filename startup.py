@@ -0,0 +1,43 @@
+import sys
+import time
+import resource
+
+# ---------------------------
+# Startup timing report
+# ---------------------------
+# bot.py imports this first and marks each startup phase; the report line in
+# the log shows where cold-start time went, current RSS, and whether any heavy
+# library that is supposed to load lazily got imported anyway.
+STARTED = time.perf_counter()
+HEAVY_MODULES = ("docxtpl", "docx", "jinja2", "lxml", "reportlab", "fastapi", "starlette", "uvicorn")
+
+_marks = []
+
+
+def mark(label):
+    _marks.append((label, time.perf_counter()))
+
+
+def elapsed():
+    return time.perf_counter() - STARTED
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        # Peak RSS (KiB on Linux) where /proc isn't available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report():
+    phases, previous = [], STARTED
+    for label, at in _marks:
+        phases.append(f"{label} {(at - previous) * 1000:.0f} ms")
+        previous = at
+    heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+    return (
+        f"Startup: {' → '.join(phases)} (total {elapsed() * 1000:.0f} ms, {len(sys.modules)} modules, "
+        f"RSS {rss_mb():.0f} MiB, heavy libraries loaded: {', '.join(heavy) or 'none'})"
+    )
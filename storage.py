@@ -0,0 +1,378 @@
+import os
+import json
+import atexit
+import sqlite3
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DATABASE_PATH = os.environ.get("DATABASE_PATH", "hrmanager.db")
+
+
+# ---------------------------
+# Schema migrations
+# ---------------------------
+# Applied in order; PRAGMA user_version records how many have run. Never edit
+# an existing entry, append a new one.
+MIGRATIONS = [
+    # 1: warnings
+    """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS warnings (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        moderator TEXT NOT NULL,
+        moderator_id INTEGER,
+        reason TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_warnings_user_time ON warnings (user_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_warnings_moderator_time ON warnings (moderator_id, created_at);
+    """,
+    # 2: keyed JSON collections (templates, campaigns, ...) and modmail tickets
+    """
+    CREATE TABLE collections (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (namespace, key)
+    ) WITHOUT ROWID;
+    CREATE TABLE modmail_tickets (
+        user_id INTEGER PRIMARY KEY,
+        channel_id INTEGER NOT NULL UNIQUE
+    );
+    """,
+]
+
+# Statements are constant strings so sqlite3's statement cache keeps them
+# prepared for the lifetime of the connection.
+SQL_META_GET = "SELECT value FROM meta WHERE key = ?"
+SQL_META_PUT = "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value"
+SQL_COLLECTION_ALL = "SELECT key, value FROM collections WHERE namespace = ?"
+SQL_COLLECTION_PUT = (
+    "INSERT INTO collections (namespace, key, value) VALUES (?, ?, ?) "
+    "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value"
+)
+SQL_COLLECTION_DELETE = "DELETE FROM collections WHERE namespace = ? AND key = ?"
+SQL_WARNING_INSERT = (
+    "INSERT INTO warnings (user_id, moderator, moderator_id, reason, created_at) VALUES (?, ?, ?, ?, ?)"
+)
+SQL_TICKETS_ALL = "SELECT user_id, channel_id FROM modmail_tickets"
+SQL_TICKET_PUT = (
+    "INSERT INTO modmail_tickets (user_id, channel_id) VALUES (?, ?) "
+    "ON CONFLICT (user_id) DO UPDATE SET channel_id = excluded.channel_id"
+)
+SQL_TICKET_DELETE = "DELETE FROM modmail_tickets WHERE user_id = ?"
+
+# Legacy JSON files imported into collections on first start
+LEGACY_COLLECTIONS = {
+    "templates.json": "docx_templates",
+    "dm_templates.json": "dm_templates",
+    "embed_templates.json": "embed_templates",
+    "dm_campaigns.json": "dm_campaigns",
+}
+
+
+# ---------------------------
+# Database
+# ---------------------------
+# One SQLite database (WAL mode) for all bot state. The connection belongs to
+# a single dedicated thread: `run` awaits work on it, `submit` queues a write
+# without waiting, and `call` blocks (startup/shutdown only). Because every
+# statement goes through that one thread, writes are serialized and can't
+# lose each other.
+class Database:
+    def __init__(self, path=DATABASE_PATH):
+        self.path = path
+        self.conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+        self._collections = []
+        self._closed = False
+        self.call(self._open)
+        atexit.register(self.close)
+
+    def _open(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+
+    def _migrate(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            self.conn.executescript(f"BEGIN; {script}; PRAGMA user_version = {number}; COMMIT;")
+            print(f"Database migrated to schema version {number}")
+
+    # ---- running work on the database thread ----
+    def call(self, func, *args):
+        try:
+            future = self._executor.submit(func, *args)
+        except RuntimeError:
+            # Interpreter exit stops executor threads before atexit handlers
+            # run; with the database thread gone it's safe to run inline
+            return func(*args)
+        return future.result()
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def submit(self, func, *args):
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(self._report)
+        return future
+
+    def _report(self, future):
+        if future.exception() is not None:
+            print(f"[WARN] Database write failed: {future.exception()}")
+
+    # ---- meta ----
+    # get_meta/set_meta block (module import); the async versions are for
+    # anything that runs on the event loop
+    def _get_meta(self, key):
+        row = self.conn.execute(SQL_META_GET, (key,)).fetchone()
+        return row["value"] if row else None
+
+    def _set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute(SQL_META_PUT, (key, value))
+
+    def get_meta(self, key):
+        return self.call(self._get_meta, key)
+
+    def set_meta(self, key, value):
+        self.call(self._set_meta, key, value)
+
+    async def get_meta_async(self, key):
+        return await self.run(self._get_meta, key)
+
+    async def set_meta_async(self, key, value):
+        await self.run(self._set_meta, key, value)
+
+    def load_collection(self, namespace):
+        # Every stored record of a namespace, decoded (blocking)
+        rows = self.call(lambda: self.conn.execute(SQL_COLLECTION_ALL, (namespace,)).fetchall())
+        return {row["key"]: json.loads(row["value"]) for row in rows}
+
+    def collection(self, namespace):
+        collection = Collection(self, namespace)
+        self._collections.append(collection)
+        return collection
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for collection in self._collections:
+            collection.flush()
+
+        def _close():
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+        self.call(_close)
+        self._executor.shutdown(wait=True)
+
+    # ---- legacy JSON import ----
+    def import_legacy_files(self, directory="."):
+        return self.call(self._import_legacy_files, directory)
+
+    def _import_legacy_files(self, directory):
+        imported = {}
+        for filename, namespace in LEGACY_COLLECTIONS.items():
+            imported[filename] = self._import_file(directory, filename, self._import_collection, namespace)
+        imported["warnings.json"] = self._import_file(directory, "warnings.json", self._import_warnings)
+        imported["modmail_tickets.json"] = self._import_file(directory, "modmail_tickets.json", self._import_tickets)
+        return {k: v for k, v in imported.items() if v is not None}
+
+    def _import_file(self, directory, filename, importer, *args):
+        path = os.path.join(directory, filename)
+        marker = f"imported:{filename}"
+        if not os.path.exists(path) or self.conn.execute(SQL_META_GET, (marker,)).fetchone():
+            return None
+        with open(path, "r") as f:
+            data = json.load(f)
+        with self.conn:
+            count = importer(path, data, *args)
+            self.conn.execute(SQL_META_PUT, (marker, str(count)))
+        os.replace(path, path + ".migrated")
+        print(f"Imported {count} records from {filename}")
+        return count
+
+    def _import_collection(self, path, data, namespace):
+        self.conn.executemany(
+            SQL_COLLECTION_PUT, [(namespace, str(key), json.dumps(value)) for key, value in data.items()]
+        )
+        return len(data)
+
+    def _import_warnings(self, path, data):
+        rows = [
+            (int(user_id), w.get("moderator", "unknown"), None, w.get("reason", ""), w.get("time", ""))
+            for user_id, entries in data.items()
+            for w in entries
+        ]
+        self.conn.executemany(SQL_WARNING_INSERT, rows)
+        return len(rows)
+
+    def _import_tickets(self, path, data):
+        tickets = {int(user_id): channel_id for user_id, channel_id in data.items()}
+        # Replay the write-behind journal the JSON snapshot was paired with
+        journal = path + ".journal"
+        if os.path.exists(journal):
+            with open(journal, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if record["op"] == "open":
+                        tickets[record["user"]] = record["channel"]
+                    else:
+                        tickets.pop(record["user"], None)
+            os.replace(journal, journal + ".migrated")
+        self.conn.executemany(SQL_TICKET_PUT, list(tickets.items()))
+        return len(tickets)
+
+
+# ---------------------------
+# Collections
+# ---------------------------
+# A namespace of JSON documents keyed by name (e.g. DOCX templates). All rows
+# are loaded once and served from memory; changes mark the key dirty and a
+# flush is queued on the database thread, which writes every dirty key in one
+# transaction. Bursts of updates to the same key coalesce into one write.
+class Collection:
+    def __init__(self, db, namespace):
+        self.db = db
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._dirty = set()
+        self._scheduled = False
+        self._data = db.load_collection(namespace)
+
+    # ---- reads ----
+    def get(self, name, default=None):
+        return self._data.get(name, default)
+
+    def __contains__(self, name):
+        return name in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def names(self):
+        return list(self._data.keys())
+
+    def all(self):
+        return dict(self._data)
+
+    # ---- writes ----
+    def set(self, name, value):
+        with self._lock:
+            self._data[name] = value
+            self._mark(name)
+
+    def delete(self, name):
+        with self._lock:
+            if self._data.pop(name, None) is None:
+                return False
+            self._mark(name)
+            return True
+
+    def update(self, name, func):
+        # Mutate one document in place under the collection lock
+        with self._lock:
+            result = func(self._data[name])
+            self._mark(name)
+            return result
+
+    def _mark(self, name):
+        self._dirty.add(name)
+        if not self._scheduled:
+            self._scheduled = True
+            self.db.submit(self._flush)
+
+    def _flush(self):
+        with self._lock:
+            keys, self._dirty = self._dirty, set()
+            self._scheduled = False
+            changes = [(key, json.dumps(self._data[key]) if key in self._data else None) for key in keys]
+        if not changes:
+            return
+        with self.db.conn:
+            for key, value in changes:
+                if value is None:
+                    self.db.conn.execute(SQL_COLLECTION_DELETE, (self.namespace, key))
+                else:
+                    self.db.conn.execute(SQL_COLLECTION_PUT, (self.namespace, key, value))
+
+    def flush(self):
+        self.db.call(self._flush)
+
+
+# ---------------------------
+# Warnings
+# ---------------------------
+# Adding a warning is one INSERT; history queries are index range scans on
+# (user_id, created_at), so they stay fast however many warnings exist.
+class WarningsStore:
+    def __init__(self, db):
+        self.db = db
+
+    def _add(self, user_id, moderator, moderator_id, reason, created_at):
+        with self.db.conn:
+            cur = self.db.conn.execute(SQL_WARNING_INSERT, (user_id, moderator, moderator_id, reason, created_at))
+        return cur.lastrowid
+
+    async def add(self, user_id, moderator, moderator_id, reason, created_at):
+        return await self.db.run(self._add, user_id, moderator, moderator_id, reason, created_at)
+
+    def _history(self, user_id, moderator=None, moderator_id=None, since=None, until=None, limit=10, offset=0):
+        where = ["user_id = ?"]
+        params = [user_id]
+        if moderator_id is not None:
+            # Rows imported from warnings.json only know the moderator's name
+            where.append("(moderator_id = ? OR (moderator_id IS NULL AND moderator = ?))")
+            params += [moderator_id, moderator]
+        if since:
+            where.append("created_at >= ?")
+            params.append(since)
+        if until:
+            where.append("created_at < ?")
+            params.append(until)
+        clause = " AND ".join(where)
+
+        total = self.db.conn.execute(f"SELECT COUNT(*) FROM warnings WHERE {clause}", params).fetchone()[0]
+        rows = self.db.conn.execute(
+            f"SELECT id, moderator, moderator_id, reason, created_at FROM warnings WHERE {clause} "
+            "ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        ).fetchall()
+        return [dict(row) for row in rows], total
+
+    async def history(self, user_id, moderator=None, moderator_id=None, since=None, until=None, limit=10, offset=0):
+        return await self.db.run(self._history, user_id, moderator, moderator_id, since, until, limit, offset)
+
+
+# ---------------------------
+# Modmail tickets
+# ---------------------------
+def load_tickets(db):
+    rows = db.call(lambda: db.conn.execute(SQL_TICKETS_ALL).fetchall())
+    return {row["user_id"]: row["channel_id"] for row in rows}
+
+
+def _write(db, sql, params):
+    with db.conn:
+        db.conn.execute(sql, params)
+
+
+def save_ticket(db, user_id, channel_id):
+    db.submit(_write, db, SQL_TICKET_PUT, (user_id, channel_id))
+
+
+def delete_ticket(db, user_id):
+    db.submit(_write, db, SQL_TICKET_DELETE, (user_id,))
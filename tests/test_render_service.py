@@ -0,0 +1,59 @@
+import os
+import signal
+import asyncio
+
+import pytest
+from docx import Document
+
+from documents import RenderService
+
+
+def _crash():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def _make_template(path):
+    doc = Document()
+    doc.add_paragraph("Dear {{ name }},")
+    doc.save(path)
+    return path
+
+
+def test_render_recovers_after_worker_crash(tmp_path):
+    template = _make_template(str(tmp_path / "template.docx"))
+    output = str(tmp_path / "out.docx")
+
+    async def scenario():
+        service = RenderService(workers=1, queue_limit=2, timeout=30)
+        try:
+            with pytest.raises(Exception):
+                await service._submit(_crash)
+            await asyncio.sleep(0)  # let the done-callback release the slot
+            assert service.pending == 0
+
+            await service.render(template, {"name": "Ada"}, output)
+            await asyncio.sleep(0)
+            assert os.path.getsize(output) > 0
+            assert service.pending == 0
+        finally:
+            service.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_failed_submits_do_not_leak_queue_slots(tmp_path):
+    template = _make_template(str(tmp_path / "template.docx"))
+
+    async def scenario():
+        service = RenderService(workers=1, queue_limit=1, timeout=30)
+        try:
+            for _ in range(3):
+                with pytest.raises(Exception):
+                    await service._submit(_crash)
+                await asyncio.sleep(0)
+            assert service.pending == 0
+            await service.render(template, {"name": "Ada"}, str(tmp_path / "out.docx"))
+        finally:
+            service.shutdown()
+
+    asyncio.run(scenario())
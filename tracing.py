@@ -0,0 +1,142 @@
+import io
+import os
+import json
+import time
+import random
+import asyncio
+import cProfile
+import pstats
+import contextlib
+import contextvars
+from collections import deque
+
+TRACE_COMMANDS = os.environ.get("TRACE_COMMANDS", "0") == "1"
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", 2000))
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 1.0))
+TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+TRACE_KEEP = int(os.environ.get("TRACE_KEEP", 200))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+DEBUG_TOKEN = os.environ.get("DEBUG_TOKEN")
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+# ---------------------------
+# Spans
+# ---------------------------
+# `with span("render docx"):` records how long the block took inside the
+# command invocation running in the current task (child tasks inherit it).
+# Outside a traced command it's a ContextVar lookup and nothing else, so the
+# shared chokepoints (wait_for, rendering, REST calls, disk writes) carry
+# spans permanently.
+@contextlib.contextmanager
+def span(name):
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append((name, started - trace.started, time.perf_counter() - started))
+
+
+class Trace:
+    def __init__(self, command, user):
+        self.command = command
+        self.user = str(user)
+        self.wall = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def to_dict(self, outcome):
+        return {
+            "command": self.command,
+            "user": self.user,
+            "time": self.wall,
+            "outcome": outcome,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "spans": [
+                {"name": name, "start_ms": round(start * 1000, 1), "duration_ms": round(duration * 1000, 1)}
+                for name, start, duration in self.spans
+            ],
+        }
+
+
+# ---------------------------
+# Command tracer
+# ---------------------------
+# Opt-in (TRACE_COMMANDS=1). The command tree calls begin/finish around every
+# slash command; a sampled invocation gets a Trace, and if it ran longer than
+# TRACE_SLOW_MS it is kept in memory for /debug/traces and appended to
+# TRACE_FILE. Independently, `arm_profile` makes the next run of one command
+# execute under cProfile. The profiler sees the whole event loop thread while
+# that command runs, so other work interleaved with it shows up as well.
+class Tracer:
+    def __init__(self, enabled=TRACE_COMMANDS, slow_ms=TRACE_SLOW_MS, sample_rate=TRACE_SAMPLE_RATE,
+                 path=TRACE_FILE, keep=TRACE_KEEP, profile_dir=PROFILE_DIR):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.path = path
+        self.profile_dir = profile_dir
+        self.recent = deque(maxlen=keep)
+        self.profiles = deque(maxlen=20)
+        self.armed = None
+        self._profiling = False
+
+    def arm_profile(self, command):
+        if self.armed or self._profiling:
+            return False
+        self.armed = command
+        return True
+
+    def begin(self, interaction):
+        command = interaction.command
+        if command is None:
+            return
+        name = command.qualified_name
+        if self.armed == name and not self._profiling:
+            self.armed = None
+            self._profiling = True
+            profiler = cProfile.Profile()
+            profiler.enable()
+            interaction.extras["profile"] = profiler
+        if self.enabled and random.random() < self.sample_rate:
+            trace = Trace(name, interaction.user)
+            interaction.extras["trace"] = trace
+            _current.set(trace)
+
+    def finish(self, interaction, outcome):
+        loop = asyncio.get_running_loop()
+        profiler = interaction.extras.pop("profile", None)
+        if profiler is not None:
+            profiler.disable()
+            loop.run_in_executor(None, self._save_profile, interaction.command.qualified_name, profiler)
+
+        trace = interaction.extras.pop("trace", None)
+        if trace is None:
+            return
+        record = trace.to_dict(outcome)
+        if record["duration_ms"] >= self.slow_ms:
+            self.recent.append(record)
+            loop.run_in_executor(None, self._append, json.dumps(record))
+
+    def _append(self, line):
+        with open(self.path, "a") as f:
+            f.write(line + "\n")
+
+    def _save_profile(self, command, profiler):
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"{command}_{int(time.time())}.prof")
+            profiler.dump_stats(path)
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+            self.profiles.append({"command": command, "time": time.time(), "file": path, "summary": out.getvalue()})
+        finally:
+            self._profiling = False
+
+
+tracer = Tracer()
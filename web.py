@@ -0,0 +1,150 @@
+import os
+import sys
+import socket
+import argparse
+import contextlib
+import uvicorn
+from fastapi import APIRouter, FastAPI, Header, Response
+from fastapi.staticfiles import StaticFiles
+from starlette.exceptions import HTTPException
+import metrics
+from tracing import tracer, DEBUG_TOKEN
+
+# ---------------------------
+# Web app (FastAPI)
+# ---------------------------
+# Only imported once the API server starts, so FastAPI, Starlette and uvicorn
+# stay out of the bot's startup path. apiserver.py decides where it runs: as a
+# task on the bot's loop, or as `python -m web` in a worker process.
+
+
+# ---------------------------
+# /generated mount
+# ---------------------------
+# Only serves live artifacts: expired files waiting for the next sweep and
+# in-progress ".part" files are answered with 404.
+class ArtifactFiles(StaticFiles):
+    def __init__(self, store, **kwargs):
+        super().__init__(directory=store.root, **kwargs)
+        self.store = store
+
+    async def get_response(self, path, scope):
+        full_path = os.path.join(self.store.root, path)
+        if path.endswith(".part") or not self.store.is_live(full_path):
+            raise HTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
+
+# ---------------------------
+# Debug routes
+# ---------------------------
+# Slow command traces and on-demand profiles. They only exist when
+# DEBUG_TOKEN is set, and each request must send it in the X-Debug-Token header.
+router = APIRouter(prefix="/debug")
+
+
+def _authorize(token):
+    if not DEBUG_TOKEN or token != DEBUG_TOKEN:
+        raise HTTPException(status_code=404)
+
+
+@router.get("/traces")
+def debug_traces(limit: int = 50, command: str = None, x_debug_token: str = Header(None)):
+    _authorize(x_debug_token)
+    traces = [t for t in list(tracer.recent) if command is None or t["command"] == command]
+    return {"enabled": tracer.enabled, "slow_ms": tracer.slow_ms, "traces": traces[-limit:][::-1]}
+
+
+@router.post("/profile/{command}")
+def debug_arm_profile(command: str, x_debug_token: str = Header(None)):
+    _authorize(x_debug_token)
+    if not tracer.arm_profile(command):
+        raise HTTPException(status_code=409, detail="A profile capture is already pending")
+    return {"armed": command}
+
+
+@router.get("/profiles")
+def debug_profiles(x_debug_token: str = Header(None)):
+    _authorize(x_debug_token)
+    return {"pending": tracer.armed, "profiles": list(tracer.profiles)[::-1]}
+
+
+def create_app(artifacts=None, admin=True):
+    # artifacts: serve /generated from this store; admin: /metrics and /debug,
+    # which read this process's counters and traces
+    app = FastAPI()
+    if artifacts is not None:
+        app.mount("/generated", ArtifactFiles(artifacts), name="generated")
+    if admin:
+        app.include_router(router)
+
+        # async so it runs on the bot's loop (where the admin app always
+        # lives) instead of Starlette's threadpool: the gauge callbacks read
+        # live bot state that only the loop may touch
+        @app.get("/metrics")
+        async def prometheus_metrics():
+            body, content_type = metrics.render_metrics()
+            return Response(body, media_type=content_type)
+
+    return app
+
+
+# ---------------------------
+# Servers
+# ---------------------------
+def config(app, shutdown_seconds, **kwargs):
+    # No lifespan handlers in this app, so skip the startup/shutdown round trip
+    return uvicorn.Config(app, lifespan="off", timeout_graceful_shutdown=shutdown_seconds, **kwargs)
+
+
+class LoopServer(uvicorn.Server):
+    # uvicorn as a task on someone else's loop: the bot owns the signal
+    # handlers and stops the server through should_exit
+    def capture_signals(self):
+        return contextlib.nullcontext()
+
+
+class FileServer(uvicorn.Server):
+    # The /generated worker process. Exits on SIGTERM (uvicorn's own handlers)
+    # and also when the bot that started it is gone.
+    def __init__(self, config, parent_pid, ready_fd=None):
+        super().__init__(config)
+        self.parent_pid = parent_pid
+        self.ready_fd = ready_fd
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        if self.started and self.ready_fd is not None:
+            os.write(self.ready_fd, b"1")
+            os.close(self.ready_fd)
+            self.ready_fd = None
+
+    async def on_tick(self, counter):
+        if counter % 10 == 0 and os.getppid() != self.parent_pid:
+            print("[WARN] Bot process exited; stopping file server")
+            self.should_exit = True
+        return await super().on_tick(counter)
+
+
+def main(argv=None):
+    from artifacts import ArtifactStore
+
+    parser = argparse.ArgumentParser(description="Serve generated/ for the bot (started by apiserver.py)")
+    parser.add_argument("--root", default="generated")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument("--parent", type=int, default=os.getppid())
+    parser.add_argument("--shutdown-seconds", type=float, default=10)
+    parser.add_argument("--fd", type=int, default=None, help="listening socket inherited from the bot")
+    parser.add_argument("--ready-fd", type=int, default=None, help="pipe to signal once serving")
+    args = parser.parse_args(argv)
+
+    # ArtifactStore reads the same ARTIFACT_* settings from the inherited env
+    app = create_app(ArtifactStore(args.root), admin=False)
+    server = FileServer(config(app, args.shutdown_seconds, host=args.host, port=args.port), args.parent, args.ready_fd)
+    server.run(sockets=[socket.socket(fileno=args.fd)] if args.fd is not None else None)
+    return 0 if server.started else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())